@@ -1,257 +1,568 @@
-from flask import Flask, redirect, url_for
+import re
+import time
+from collections import defaultdict
+from importlib import import_module
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
+
+from flask import Flask, current_app, g, has_request_context, redirect, request, url_for
+from sqlalchemy import event
 from .config import Config
 from .extensions import db, login_manager, csrf
+from .json_provider import ORJSONProvider, orjson
 from .models import User, Module
 from flask_wtf.csrf import generate_csrf
 
+try:
+    import redis
+    from flask_session import Session
+except ImportError:  # optional dependencies (server-side sessions)
+    redis = Session = None
+
+# Connection-level settings applied to every SQLite connection opened by the
+# engine.  WAL journaling lets readers proceed while a write is in progress
+# and, together with ``synchronous=NORMAL``, avoids an fsync on every commit.
+# The remaining pragmas enlarge the page cache, keep temporary tables in
+# memory, memory-map the database file and wait for locks instead of failing
+# immediately with "database is locked".
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-64000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',
+    # Keep the query planner statistics fresh.  ``analysis_limit`` bounds
+    # the work done by ``optimize``; the 0x10002 mask is the variant SQLite
+    # recommends when a connection is opened.
+    'PRAGMA analysis_limit=400',
+    'PRAGMA optimize=0x10002',
+)
+
+# Pooled connections live for the whole process, so ``PRAGMA optimize`` is
+# also run when a connection is returned to the pool, at most once per
+# connection every ``SQLITE_OPTIMIZE_INTERVAL`` seconds.
+SQLITE_OPTIMIZE_INTERVAL = 3600
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configure a freshly opened SQLite connection (engine ``connect`` event)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+    connection_record.info['optimized_at'] = time.monotonic()
+
+
+def _optimize_sqlite_connection(dbapi_connection, connection_record):
+    """Run ``PRAGMA optimize`` on check-in to the pool (pool ``checkin`` event)."""
+    if dbapi_connection is None:
+        return
+    now = time.monotonic()
+    if now - connection_record.info.get('optimized_at', 0.0) < SQLITE_OPTIMIZE_INTERVAL:
+        return
+    connection_record.info['optimized_at'] = now
+    try:
+        dbapi_connection.execute('PRAGMA optimize')
+    except Exception:
+        pass
+
+
+# Template context exposing ``csrf_token()``.  Built once and returned as-is
+# by the context processor; Flask only reads from it when rendering.
+_CSRF_CONTEXT = {'csrf_token': generate_csrf}
+
+# Blueprints registered by ``create_app`` as ``(name, module, attribute,
+# url_prefix)``.  Route modules are imported by name so that a worker can be
+# restricted to a subset of them through ``Config.APP_BLUEPRINTS``;
+# ``REQUIRED_BLUEPRINTS`` are registered regardless, since the login flow and
+# the page header build URLs for them.
+REQUIRED_BLUEPRINTS = frozenset({'auth', 'dashboard'})
+BLUEPRINTS = (
+    ('auth', '.blueprints.auth.routes', 'auth_bp', '/auth'),
+    ('dashboard', '.blueprints.dashboard.routes', 'dashboard_bp', '/dashboard'),
+    ('admin', '.blueprints.admin.routes', 'admin_bp', '/admin'),
+    ('inventory', '.blueprints.inventory.routes', 'inventory_bp', '/inventory'),
+    ('production', '.blueprints.production.routes', 'production_bp', '/production'),
+    ('kpi', '.blueprints.kpi.routes', 'kpi_bp', '/kpi'),
+    ('products', '.blueprints.products.routes', 'products_bp', '/products'),
+    # Register API blueprint at the root '/api' path
+    ('api', '.blueprints.api', 'api_bp', '/api'),
+)
+
+
+# Navigation modules shown in the header of every page.  Module enablement
+# changes rarely, so ``create_app`` loads a snapshot of the enabled modules
+# into ``app.config['ENABLED_MODULES']`` at start-up and the context
+# processor serves it without touching the database.  Inserting, updating
+# or deleting a ``Module`` row discards the snapshot (see the mapper events
+# registered below) and the next render reloads it.  The same events also
+# discard ``app.config['ADMIN_MODULES']``, the full module list cached by
+# the admin modules page.  The events only fire in the process that wrote
+# the row, so the snapshot also expires after ``ENABLED_MODULES_TTL``
+# seconds: a module toggled through another worker shows up within that.
+ENABLED_MODULES_TTL = 30
+
+
+def _load_enabled_modules():
+    """Return the enabled modules as ``(id, name, slug, endpoint)`` rows."""
+    return tuple(
+        db.session.query(Module.id, Module.name, Module.slug, Module.endpoint)
+        .filter_by(enabled=True)
+        .order_by(Module.name.asc())
+        .all()
+    )
+
+
+def _enabled_modules(app):
+    """Return the ``ENABLED_MODULES`` snapshot, reloading it when stale."""
+    modules = app.config.get('ENABLED_MODULES')
+    now = time.monotonic()
+    if modules is None or now - app.config.get('ENABLED_MODULES_LOADED_AT', 0) >= ENABLED_MODULES_TTL:
+        modules = app.config['ENABLED_MODULES'] = _load_enabled_modules()
+        app.config['ENABLED_MODULES_LOADED_AT'] = now
+    return modules
+
+
+def _clear_enabled_modules(mapper, connection, target):
+    current_app.config['ENABLED_MODULES'] = None
+    current_app.config['ADMIN_MODULES'] = None
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Module, _event_name, _clear_enabled_modules)
+
+
+# Version of the runtime schema upgrades performed by ``upgrade_database``.
+# The value is stored in SQLite's ``PRAGMA user_version`` once the upgrade
+# has completed so that subsequent start-ups can skip the PRAGMA/ALTER
+# cascade entirely.  Bump this number whenever a new table, column or index
+# is added.
+SCHEMA_VERSION = 4
+
+
+# Columns added to existing tables after their first release, as
+# ``{table: {column: SQL type}}``.  ``db.create_all()`` never alters existing
+# tables, so ``upgrade_database`` adds any of these that a database created by
+# an older version is missing.
+REQUIRED_COLUMNS = {
+    # Hourly cost of a work center, used for cycle cost computations.
+    'work_centers': {
+        'hourly_cost': 'FLOAT',
+    },
+    # Default "definisci" details applied to nodes created from a type.
+    'structure_types': {
+        'default_work_phase_id': 'INTEGER',
+        'default_processing_type': 'TEXT',
+        'default_supplier_id': 'INTEGER',
+        'default_work_center_id': 'INTEGER',
+        'default_weight': 'FLOAT',
+        'default_processing_cost': 'FLOAT',
+        'default_standard_time': 'FLOAT',
+        'default_lead_time_theoretical': 'FLOAT',
+        'default_lead_time_real': 'FLOAT',
+        'default_description': 'TEXT',
+        'default_notes': 'TEXT',
+        'default_price_per_unit': 'FLOAT',
+        'default_minimum_order_qty': 'INTEGER',
+        'default_image_filename': 'VARCHAR(255)',
+    },
+    'structures': {
+        # "Definisci" details of a node.
+        'work_phase_id': 'INTEGER',
+        'processing_type': 'TEXT',
+        'supplier_id': 'INTEGER',
+        'work_center_id': 'INTEGER',
+        'weight': 'FLOAT',
+        'processing_cost': 'FLOAT',
+        'standard_time': 'FLOAT',
+        'lead_time_theoretical': 'FLOAT',
+        'lead_time_real': 'FLOAT',
+        'description': 'TEXT',
+        'notes': 'TEXT',
+        'price_per_unit': 'FLOAT',
+        'minimum_order_qty': 'INTEGER',
+        # Reference to the ComponentMaster.  SQLite cannot add a foreign key
+        # with ALTER TABLE, so the column is added without the constraint.
+        'component_id': 'INTEGER',
+        'is_sellable': 'BOOLEAN',
+        'guiding_part': 'BOOLEAN',
+        # On-hand quantity of parts and commercial components.
+        'quantity_in_stock': 'FLOAT',
+        # Comma-separated list of prior revision labels still compatible.
+        'compatible_revisions': 'TEXT',
+        # Revision index (0 = not yet revised).
+        'revision': 'INTEGER DEFAULT 0',
+    },
+    'product_components': {
+        'component_id': 'INTEGER',
+        'is_sellable': 'BOOLEAN',
+        'guiding_part': 'BOOLEAN',
+    },
+    'products': {
+        'flow_rate': 'FLOAT',
+        'max_pressure': 'FLOAT',  # legacy single max pressure column
+        'dimension_x': 'FLOAT',
+        'dimension_y': 'FLOAT',
+        'dimension_z': 'FLOAT',
+        'curve_image_filename': 'VARCHAR(200)',
+        'fluid_in_let': 'VARCHAR(50)',
+        'layer_in_lett': 'VARCHAR(50)',
+        'noise': 'FLOAT',
+        'max_pressure_from': 'FLOAT',
+        'max_pressure_to': 'FLOAT',
+        # On-hand quantity of built or loaded products.
+        'quantity_in_stock': 'FLOAT',
+    },
+    # Global defaults mirrored by product components and structures.
+    'component_masters': {
+        'is_sellable': 'BOOLEAN',
+        'guiding_part': 'BOOLEAN',
+    },
+    # Login name; legacy databases only stored email addresses.
+    'users': {
+        'username': 'TEXT',
+    },
+}
+
+
+# DDL identifiers cannot be bound as SQL parameters, so every table and
+# column name interpolated into the statements below must match this
+# whitelist pattern.
+_SQL_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _add_column_sql(table_name, col_name, col_type):
+    """Return the ``ALTER TABLE ... ADD COLUMN`` statement for one column."""
+    for identifier in (table_name, col_name):
+        if not _SQL_IDENTIFIER_RE.match(identifier):
+            raise ValueError(f'Invalid SQL identifier: {identifier!r}')
+    return f'ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}'
+
+
+# Every ALTER TABLE statement the upgrade may need, built once at import as
+# ``{(table, column): sql}`` in ``REQUIRED_COLUMNS`` order.
+ADD_COLUMN_STATEMENTS = {
+    (table_name, col_name): _add_column_sql(table_name, col_name, col_type)
+    for table_name, columns in REQUIRED_COLUMNS.items()
+    for col_name, col_type in columns.items()
+}
+
+
+# Indexes declared on the models after their tables were first released.
+# ``db.create_all()`` skips tables that already exist together with their
+# indexes, so ``upgrade_database`` creates these on older databases.  The
+# statements are derived from the model metadata so the two cannot drift.
+REQUIRED_INDEXES = ('ix_structure_lookup', 'ix_structure_global')
+
+
+def _create_index_statements():
+    """Return ``CREATE INDEX IF NOT EXISTS`` statements for ``REQUIRED_INDEXES``."""
+    from sqlalchemy.dialects import sqlite
+    from sqlalchemy.schema import CreateIndex
+
+    indexes = {
+        index.name: index
+        for table in db.metadata.tables.values()
+        for index in table.indexes
+    }
+    return [
+        str(CreateIndex(indexes[name], if_not_exists=True).compile(dialect=sqlite.dialect()))
+        for name in REQUIRED_INDEXES
+    ]
+
+
+def _normalised_username(user_id, email, username):
+    """Return the username a ``users`` row should have after the upgrade.
+
+    Keep the existing value (lower-cased), otherwise fall back to the local
+    part of the email address, the whole email address and finally
+    ``user_<id>``.
+    """
+    local_part = email.partition('@')[0] if email and '@' in email else None
+    for candidate in (username, local_part, email):
+        if candidate:
+            return candidate.lower()
+    return f'user_{user_id}'
+
+
+def _existing_columns(cursor):
+    """Return ``{table: set of column names}`` for the tables we upgrade.
+
+    The column names of every table are read with a single query, joining
+    ``sqlite_master`` against the ``pragma_table_info`` table-valued
+    function instead of issuing one PRAGMA per table.  ``cursor`` is a
+    DBAPI (sqlite3) cursor.
+    """
+    table_list = ', '.join(f"'{table_name}'" for table_name in REQUIRED_COLUMNS)
+    cols_by_table = defaultdict(set)
+    rows = cursor.execute(
+        "SELECT m.name, p.name FROM sqlite_master AS m "
+        "JOIN pragma_table_info(m.name) AS p "
+        f"WHERE m.type = 'table' AND m.name IN ({table_list})"
+    ).fetchall()
+    for table_name, col_name in rows:
+        cols_by_table[table_name].add(col_name)
+    return cols_by_table
+
+
+def _upgrade_statements(cols_by_table):
+    """Return the SQL statements needed to bring an older database up to date.
+
+    ``db.create_all()`` creates tables that do not yet exist but does not
+    add missing columns to existing tables.  Because migrations are not
+    available in this simplified setup, every column in ``REQUIRED_COLUMNS``
+    is checked against the table's current columns and the prebuilt
+    ``ALTER TABLE`` statement is returned for each one that is absent.
+    """
+    return [
+        sql for (table_name, col_name), sql in ADD_COLUMN_STATEMENTS.items()
+        if col_name not in cols_by_table[table_name]
+    ]
+
+
+def _backfill_usernames(cursor, user_cols):
+    """Populate usernames for legacy records that only stored an email address.
+
+    Only rows whose username is empty or not lower-case are read; the new
+    values are derived in Python and written back with one ``executemany``.
+    Databases created by the current models have no ``email`` column, in
+    which case only the ``user_<id>`` fallback applies.
+    """
+    email_col = 'email' if 'email' in user_cols else 'NULL'
+    rows = cursor.execute(
+        f"SELECT id, {email_col}, username FROM users "
+        "WHERE username IS NULL OR username = '' OR username <> LOWER(username)"
+    ).fetchall()
+    cursor.executemany(
+        'UPDATE users SET username = ? WHERE id = ?',
+        [(_normalised_username(user_id, email, username), user_id) for user_id, email, username in rows],
+    )
+
+
+def schema_marker_path():
+    """Return the path of the schema version marker for the SQLite database.
+
+    The marker sits next to the database file and records the
+    ``SCHEMA_VERSION`` it was last upgraded to.  Returns ``None`` for
+    in-memory databases and non-SQLite backends.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return None
+    database = db.engine.url.database
+    if not database or database == ':memory:':
+        return None
+    return database + '.schema'
+
+
+def _upgrade_sqlite_schema():
+    """Add missing columns to the SQLite database; return ``True`` on success."""
+    # -------------------------------------------------------------------
+    # Bring older database files up to date.  The upgrade only runs when
+    # the schema version recorded in the database is older than
+    # ``SCHEMA_VERSION``; once it has completed the version marker is
+    # stored so that later start-ups skip the column checks entirely.
+    #
+    # The ALTER statements are prebuilt static DDL, so they are sent straight
+    # to the sqlite3 driver instead of going through SQLAlchemy's statement
+    # compilation.  The whole upgrade, including the version check and the
+    # column introspection, runs in one ``BEGIN IMMEDIATE`` transaction: the
+    # write lock is taken up front so a concurrent process cannot change the
+    # schema between the check and the ALTERs, ``sqlite_master`` stays hot
+    # in the page cache and a legacy database pays for a single commit.  If
+    # any statement fails the transaction is rolled back when the connection
+    # returns to the pool.
+    try:
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            current_version = cursor.execute('PRAGMA user_version').fetchone()[0] or 0
+            if current_version < SCHEMA_VERSION:
+                cols_by_table = _existing_columns(cursor)
+                for statement in _upgrade_statements(cols_by_table):
+                    cursor.execute(statement)
+                for statement in _create_index_statements():
+                    cursor.execute(statement)
+                _backfill_usernames(cursor, cols_by_table['users'])
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            raw.commit()
+            cursor.close()
+        finally:
+            raw.close()
+    except Exception:
+        # Do not prevent the application from starting.  Missing columns
+        # will cause errors elsewhere, so log the failure to let a developer
+        # intervene manually.
+        current_app.logger.warning('Aggiornamento dello schema del database fallito', exc_info=True)
+        return False
+    return True
+
+
+def upgrade_database():
+    """Create missing tables and bring the schema up to ``SCHEMA_VERSION``.
+
+    Must be called inside an application context.  ``create_app`` runs it
+    on start-up when ``AUTO_MIGRATE`` is enabled; deployments that disable
+    it run ``python manage.py migrate-schema`` once after an update instead.
+    """
+    marker = schema_marker_path()
+    if marker is None:
+        # Create all tables defined in the SQLAlchemy models.  The column
+        # checks rely on SQLite PRAGMAs and in-place ALTER TABLE; other
+        # backends are expected to be migrated explicitly.
+        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            _upgrade_sqlite_schema()
+        return
+
+    # When several workers start at once only one of them needs to upgrade
+    # the database.  Once the marker file next to the database records the
+    # current ``SCHEMA_VERSION``, start-up costs a file read and a
+    # ``PRAGMA user_version`` query.  Otherwise the workers serialise on an
+    # exclusive lock on the marker: the first one performs the upgrade and
+    # the others, once they acquire the lock, find it up to date and skip it.
+    # The marker alone is not trusted: a database file deleted or replaced
+    # by an older copy has a lower ``user_version`` (0 for a new, empty
+    # file), so its tables and columns are still created.
+    def _marker_current(fh):
+        fh.seek(0)
+        if fh.read().strip() != str(SCHEMA_VERSION):
+            return False
+        with db.engine.connect() as conn:
+            return conn.exec_driver_sql('PRAGMA user_version').scalar() == SCHEMA_VERSION
+
+    try:
+        with open(marker, 'r', encoding='utf-8') as fh:
+            if _marker_current(fh):
+                return
+    except OSError:
+        pass
+    with open(marker, 'a+', encoding='utf-8') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            if _marker_current(fh):
+                return
+            # Create all tables defined in the SQLAlchemy models.  This call
+            # creates tables that do not yet exist but does not add missing
+            # columns to existing tables; those are handled by
+            # ``_upgrade_sqlite_schema``.
+            db.create_all()
+            if _upgrade_sqlite_schema():
+                fh.seek(0)
+                fh.truncate()
+                fh.write(str(SCHEMA_VERSION))
+                fh.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _init_server_side_sessions(app):
+    """Store sessions in Redis when ``SESSION_REDIS_URL`` is configured.
+
+    The views keep using ``flask.session`` unchanged; only the storage moves
+    from the signed cookie to the server.  Without the URL, or without the
+    optional packages, the default cookie sessions are kept.
+    """
+    url = app.config.get('SESSION_REDIS_URL')
+    if not url:
+        return
+    if Session is None:
+        app.logger.warning('SESSION_REDIS_URL is set but Flask-Session/redis are not installed; '
+                           'using cookie sessions.')
+        return
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config.setdefault('SESSION_REDIS', redis.Redis.from_url(url))
+    Session(app)
+
+
+def _count_request_query(conn, cursor, statement, parameters, context, executemany):
+    """Count the statements issued by the current request (engine event)."""
+    if has_request_context():
+        g._sql_query_count = g.get('_sql_query_count', 0) + 1
+
+
+def _init_query_counter(app):
+    """Log requests issuing more than ``SQL_QUERY_WARN_THRESHOLD`` statements."""
+    threshold = app.config.get('SQL_QUERY_WARN_THRESHOLD') or 0
+    if threshold <= 0:
+        return
+    event.listen(db.engine, 'before_cursor_execute', _count_request_query)
+
+    @app.after_request
+    def _warn_on_query_count(response):
+        count = g.get('_sql_query_count', 0)
+        if count > threshold:
+            app.logger.warning('%s %s issued %d SQL statements (threshold %d)',
+                               request.method, request.path, count, threshold)
+        return response
+
+
 def create_app(config_class=Config):
     app = Flask(__name__, static_folder='static', template_folder='templates')
     app.config.from_object(config_class)
 
+    # Serialise JSON responses compactly (also in debug mode) and with orjson
+    # when it is installed; the /api endpoints are hit by background fetches
+    # on most pages.
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
+    app.json.compact = True
+
     db.init_app(app)
     login_manager.init_app(app)
+    _init_server_side_sessions(app)
     csrf.init_app(app)
 
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _apply_sqlite_pragmas)
+            event.listen(db.engine, 'checkin', _optimize_sqlite_connection)
+        _init_query_counter(app)
+
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
 
-    from .blueprints.auth.routes import auth_bp
-    from .blueprints.dashboard.routes import dashboard_bp
-    from .blueprints.admin.routes import admin_bp
-    from .blueprints.inventory.routes import inventory_bp
-    from .blueprints.production.routes import production_bp
-    from .blueprints.kpi.routes import kpi_bp
-    from .blueprints.products.routes import products_bp
-    from .blueprints.api import api_bp
-
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
-    app.register_blueprint(admin_bp, url_prefix='/admin')
-    app.register_blueprint(inventory_bp, url_prefix='/inventory')
-    app.register_blueprint(production_bp, url_prefix='/production')
-    app.register_blueprint(kpi_bp, url_prefix='/kpi')
-    app.register_blueprint(products_bp, url_prefix='/products')
-    # Register API blueprint at the root '/api' path
-    app.register_blueprint(api_bp, url_prefix='/api')
-    # Exempt API routes from CSRF protection as they are invoked via
-    # asynchronous fetch requests that do not include the CSRF token.
-    try:
-        csrf.exempt(api_bp)
-    except Exception:
-        pass
+    # Import and register the blueprints.  Workers restricted through
+    # ``APP_BLUEPRINTS`` register only the selected blueprints plus
+    # ``REQUIRED_BLUEPRINTS``; the route modules of the others are not
+    # imported unless a registered module imports them itself.
+    selected = app.config.get('APP_BLUEPRINTS')
+    for name, module_path, attr, url_prefix in BLUEPRINTS:
+        if selected and name not in selected and name not in REQUIRED_BLUEPRINTS:
+            continue
+        bp = getattr(import_module(module_path, __name__), attr)
+        app.register_blueprint(bp, url_prefix=url_prefix)
+        if name == 'api':
+            # Exempt API routes from CSRF protection as they are invoked via
+            # asynchronous fetch requests that do not include the CSRF token.
+            try:
+                csrf.exempt(bp)
+            except Exception:
+                pass
 
     with app.app_context():
-        # Create all tables defined in the SQLAlchemy models.  This call
-        # creates tables that do not yet exist but does not add missing
-        # columns to existing tables.  Because the database schema may
-        # evolve over time and migrations are not available in this
-        # simplified setup, we perform additional checks to ensure
-        # critical columns exist.  In particular, the ``work_centers``
-        # table gained an ``hourly_cost`` column in a later version of
-        # the application.  Attempting to query this column on older
-        # databases will raise an OperationalError ("no such column").
-        db.create_all()
-
-        # -------------------------------------------------------------------
-        # Ensure ``hourly_cost`` column exists on ``work_centers`` table.
-        #
-        # When upgrading from previous versions without running a formal
-        # migration, the ``work_centers`` table may be missing the
-        # ``hourly_cost`` column.  This runtime check inspects the table
-        # schema via SQLite PRAGMA and, if necessary, issues an ALTER
-        # TABLE statement to add the column.  The operation is idempotent on
-        # SQLite and will only execute once when the column is missing.  On
-        # other database backends, explicit migrations are preferred.
+        if app.config.get('AUTO_MIGRATE', True):
+            upgrade_database()
+            if 'admin' in app.blueprints:
+                # Inventory columns added by the admin module; checking them
+                # here keeps the schema introspection out of the request path.
+                from .blueprints.admin.routes import _ensure_inventory_columns
+                _ensure_inventory_columns()
         try:
-            from sqlalchemy import text
-            conn = db.engine.connect()
-            res = conn.execute(text('PRAGMA table_info(work_centers)')).fetchall()
-            col_names = [row[1] for row in res]
-            if 'hourly_cost' not in col_names:
-                conn.execute(text('ALTER TABLE work_centers ADD COLUMN hourly_cost FLOAT'))
-
-            # -----------------------------------------------------------------
-            # Ensure new columns exist on structure_types and structures tables.
-            #
-            # When adding support for definisci details on types and nodes, new
-            # columns were introduced on the ``structure_types`` and
-            # ``structures`` tables.  Older database files will not have
-            # these columns, resulting in OperationalError when SQLAlchemy
-            # attempts to access them.  The following runtime checks use
-            # SQLite PRAGMA to inspect the table schemas and add missing
-            # columns via ALTER TABLE statements.  Since SQLite supports
-            # adding columns in place (without foreign key constraints), this
-            # approach is safe and idempotent.
-            # Check structure_types table
-            res_types = conn.execute(text('PRAGMA table_info(structure_types)')).fetchall()
-            type_cols = [row[1] for row in res_types]
-            # Map of column name to SQL type
-            type_column_defs = {
-                'default_work_phase_id': 'INTEGER',
-                'default_processing_type': 'TEXT',
-                'default_supplier_id': 'INTEGER',
-                'default_work_center_id': 'INTEGER',
-                'default_weight': 'FLOAT',
-                'default_processing_cost': 'FLOAT',
-                'default_standard_time': 'FLOAT',
-                'default_lead_time_theoretical': 'FLOAT',
-                'default_lead_time_real': 'FLOAT',
-                'default_description': 'TEXT',
-                'default_notes': 'TEXT',
-                'default_price_per_unit': 'FLOAT',
-                'default_minimum_order_qty': 'INTEGER'
-            }
-            for col_name, col_type in type_column_defs.items():
-                if col_name not in type_cols:
-                    conn.execute(text(f'ALTER TABLE structure_types ADD COLUMN {col_name} {col_type}'))
-            # Check structures table
-            res_structs = conn.execute(text('PRAGMA table_info(structures)')).fetchall()
-            struct_cols = [row[1] for row in res_structs]
-            struct_column_defs = {
-                'work_phase_id': 'INTEGER',
-                'processing_type': 'TEXT',
-                'supplier_id': 'INTEGER',
-                'work_center_id': 'INTEGER',
-                'weight': 'FLOAT',
-                'processing_cost': 'FLOAT',
-                'standard_time': 'FLOAT',
-                'lead_time_theoretical': 'FLOAT',
-                'lead_time_real': 'FLOAT',
-                'description': 'TEXT',
-                'notes': 'TEXT',
-                'price_per_unit': 'FLOAT',
-                'minimum_order_qty': 'INTEGER',
-                # New column introduced when adding ComponentMaster support.  A
-                # structure references a master component via this nullable
-                # foreign key.  SQLite does not enforce foreign key
-                # constraints on ALTER TABLE, but the column is needed for
-                # application logic.
-                'component_id': 'INTEGER'
-                ,
-                # Additional boolean flags for structures.  These columns were
-                # introduced to support sellable and guiding part flags on
-                # structures.  They default to NULL/False when not present.
-                'is_sellable': 'BOOLEAN',
-                'guiding_part': 'BOOLEAN',
-                # On‑hand inventory quantity.  Assemblies compute their
-                # available stock based on children, whereas parts and
-                # commercial components track how many units are
-                # available directly.  Stored as FLOAT for consistency.
-                'quantity_in_stock': 'FLOAT',
-                # Compatible revisions column stores a comma‑separated list of
-                # prior revision labels selected as compatible for a
-                # structure.  Added dynamically to maintain backwards
-                # compatibility with existing databases.
-                'compatible_revisions': 'TEXT'
-            }
-            for col_name, col_type in struct_column_defs.items():
-                if col_name not in struct_cols:
-                    conn.execute(text(f'ALTER TABLE structures ADD COLUMN {col_name} {col_type}'))
-
-            # -----------------------------------------------------------------
-            # Ensure ``component_id`` column exists on ``product_components`` table.
-            #
-            # The product_components table gained a component_id column when
-            # migrating to the ComponentMaster architecture.  Older
-            # databases will not have this column, so we add it at runtime
-            # when missing.  Since SQLite does not support adding foreign
-            # keys via ALTER TABLE, the new column is created without a
-            # constraint.  The ORM will still map it correctly and
-            # application logic enforces referential integrity.
-            res_pcs = conn.execute(text('PRAGMA table_info(product_components)')).fetchall()
-            pc_cols = [row[1] for row in res_pcs]
-            if 'component_id' not in pc_cols:
-                conn.execute(text('ALTER TABLE product_components ADD COLUMN component_id INTEGER'))
-
-            # -----------------------------------------------------------------
-            # Ensure extended columns exist on ``products`` table.
-            #
-            # When adding support for flow rate, maximum pressure, dimensions
-            # and characteristic curve images on products, additional
-            # columns were introduced on the ``products`` table.  Older
-            # database files will be missing these columns, resulting in
-            # OperationalError when SQLAlchemy attempts to access them.  The
-            # following block checks for their existence and adds any
-            # missing columns via ALTER TABLE statements.  The operation is
-            # idempotent and only runs when necessary.
-            res_prod = conn.execute(text('PRAGMA table_info(products)')).fetchall()
-            prod_cols = [row[1] for row in res_prod]
-            prod_column_defs = {
-                'flow_rate': 'FLOAT',
-                'max_pressure': 'FLOAT',  # legacy single max pressure column
-                'dimension_x': 'FLOAT',
-                'dimension_y': 'FLOAT',
-                'dimension_z': 'FLOAT',
-                'curve_image_filename': 'VARCHAR(200)',
-                # New columns for extended specifications
-                'fluid_in_let': 'VARCHAR(50)',
-                'layer_in_lett': 'VARCHAR(50)',
-                'noise': 'FLOAT',
-                'max_pressure_from': 'FLOAT',
-                'max_pressure_to': 'FLOAT'
-                ,
-                # On-hand inventory quantity for products.  Added to
-                # support tracking of physically built or loaded units
-                # directly on the product rather than via the Structure
-                # model.  Defaults to zero when absent.
-                'quantity_in_stock': 'FLOAT'
-            }
-            for col_name, col_type in prod_column_defs.items():
-                if col_name not in prod_cols:
-                    conn.execute(text(f'ALTER TABLE products ADD COLUMN {col_name} {col_type}'))
-
-            # -----------------------------------------------------------------
-            # Ensure additional boolean columns exist on ``product_components`` table.
-            #
-            # The flags ``is_sellable`` and ``guiding_part`` were introduced to
-            # designate whether a component is sellable and whether it acts
-            # as a guiding part.  Older database files will not have these
-            # columns, so add them via ALTER TABLE when missing.  SQLite
-            # performs this operation safely and idempotently.
-            res_pc = conn.execute(text('PRAGMA table_info(product_components)')).fetchall()
-            pc_cols = [row[1] for row in res_pc]
-            if 'is_sellable' not in pc_cols:
-                conn.execute(text('ALTER TABLE product_components ADD COLUMN is_sellable BOOLEAN'))
-            if 'guiding_part' not in pc_cols:
-                conn.execute(text('ALTER TABLE product_components ADD COLUMN guiding_part BOOLEAN'))
-
-            # -----------------------------------------------------------------
-            # Ensure boolean columns exist on ``component_masters`` table.
-            #
-            # The columns ``is_sellable`` and ``guiding_part`` on the
-            # component_masters table mirror the flags defined on product
-            # components and structures.  They provide global defaults
-            # for components.  Add the columns when absent.
-            res_cm = conn.execute(text('PRAGMA table_info(component_masters)')).fetchall()
-            cm_cols = [row[1] for row in res_cm]
-            if 'is_sellable' not in cm_cols:
-                conn.execute(text('ALTER TABLE component_masters ADD COLUMN is_sellable BOOLEAN'))
-            if 'guiding_part' not in cm_cols:
-                conn.execute(text('ALTER TABLE component_masters ADD COLUMN guiding_part BOOLEAN'))
-
-            # -----------------------------------------------------------------
-            # Ensure ``username`` column exists on the ``users`` table and
-            # populate it for legacy records that previously stored only
-            # email addresses.  The username column enables authentication
-            # without relying on email addresses while maintaining
-            # backwards compatibility with existing databases.
-            res_users = conn.execute(text('PRAGMA table_info(users)')).fetchall()
-            user_cols = [row[1] for row in res_users]
-            if 'username' not in user_cols:
-                conn.execute(text('ALTER TABLE users ADD COLUMN username TEXT'))
-            conn.execute(text("UPDATE users SET username = LOWER(username) WHERE username IS NOT NULL AND username <> ''"))
-            conn.execute(text("UPDATE users SET username = LOWER(substr(email, 1, instr(email, '@') - 1)) WHERE (username IS NULL OR username = '') AND email LIKE '%@%'"))
-            conn.execute(text("UPDATE users SET username = LOWER(email) WHERE (username IS NULL OR username = '') AND email IS NOT NULL"))
-            conn.execute(text("UPDATE users SET username = 'user_' || id WHERE (username IS NULL OR username = '')"))
-
-            conn.commit()
-            conn.close()
+            _enabled_modules(app)
         except Exception:
-            # Silently ignore errors during the schema check.  Missing
-            # columns will cause errors elsewhere, at which point a
-            # developer can manually intervene.  Logging could be added
-            # here for visibility.
-            pass
+            # The modules table may not exist yet (AUTO_MIGRATE disabled on
+            # a fresh database); the snapshot is then loaded on first render.
+            db.session.rollback()
+            app.config['ENABLED_MODULES'] = None
 
     @app.route('/')
     def root():
@@ -259,11 +570,15 @@ def create_app(config_class=Config):
 
     @app.context_processor
     def inject_csrf_token():
-        return dict(csrf_token=generate_csrf)
+        return _CSRF_CONTEXT
 
     @app.context_processor
     def inject_enabled_modules():
-        modules = Module.query.filter_by(enabled=True).order_by(Module.name.asc()).all()
+        modules = _enabled_modules(app)
+        if selected:
+            # Hide modules whose blueprint is not registered in this worker,
+            # otherwise ``url_for`` in the navigation would fail.
+            modules = [m for m in modules if m.endpoint.split('.', 1)[0] in app.blueprints]
         return {'enabled_modules': modules}
 
     return app
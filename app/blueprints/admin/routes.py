@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, session, g
 from flask_login import login_required, current_user
 from ...extensions import login_manager
 from ...extensions import db
+from ... import upgrade_database
 from ...models import (
     Module, StructureType, Structure, User, Supplier, WorkCenter, WorkPhase,
     MaterialCost, Product, ProductComponent, ComponentMaster, BOMLine,
@@ -10,17 +11,28 @@ from ...models import (
     ProductionBox, InventoryLog, Reservation
 )
 from types import SimpleNamespace
+from dataclasses import dataclass
+from sqlalchemy.orm import joinedload
+from collections import defaultdict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, zip_longest
 
+import glob
+import json
 import os
+import re
+import threading
+import time
+import sqlite3
 import shutil  # used for copying images and documents when copying defaults
 from werkzeug.utils import secure_filename
-from flask import send_file
+from flask import Response, stream_with_context
 
 # Import checklist loader for document flagging
 from ...checklist import load_checklist
 import tempfile
 import zipfile
-import io
 
 # -----------------------------------------------------------------------------
 # Component master helpers
@@ -33,6 +45,583 @@ import io
 # called during node creation and editing to ensure data remains
 # consistent.
 
+# Chunk size for copies that cannot be done inside the kernel and for
+# saving uploaded files (Werkzeug defaults to 16 KiB reads).
+_COPY_BUFSIZE = 1024 * 1024
+
+
+def _fastcopy(src: str, dst: str, exclusive: bool = False) -> None:
+    """Copy the contents of ``src`` to ``dst``.
+
+    Uses ``os.copy_file_range`` when available, which copies inside the
+    kernel and lets copy-on-write or network filesystems clone the data
+    server side, then ``os.sendfile``, and finally a plain read/write loop
+    with a 1 MiB buffer.  Like ``shutil.copyfile`` only the data is copied,
+    not the permission bits.  With ``exclusive`` the destination is created
+    with ``O_EXCL`` and ``FileExistsError`` is raised when it already
+    exists, which replaces a separate ``os.path.exists`` check.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'xb' if exclusive else 'wb') as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(infd).st_size
+        for kernel_copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if kernel_copy is None or size == 0:
+                continue
+            try:
+                offset = 0
+                while offset < size:
+                    if kernel_copy is os.sendfile:
+                        sent = os.sendfile(outfd, infd, offset, size - offset)
+                    else:
+                        sent = os.copy_file_range(infd, outfd, size - offset, offset, offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                if offset >= size:
+                    return
+            except OSError:
+                # Not supported between these files (e.g. across filesystems
+                # on older kernels); start over with the next strategy.
+                pass
+            os.ftruncate(outfd, 0)
+            os.lseek(outfd, 0, os.SEEK_SET)
+        fsrc.seek(0)
+        shutil.copyfileobj(fsrc, fdst, _COPY_BUFSIZE)
+
+
+# Upper bound on the threads used to copy a document tree.
+_COPY_WORKERS = 8
+
+
+def _copy_if_missing(pair) -> None:
+    """Copy ``pair[0]`` to ``pair[1]`` unless the destination already exists."""
+    src, dst = pair
+    try:
+        _fastcopy(src, dst, exclusive=True)
+    except Exception:
+        # Includes FileExistsError: existing files are preserved
+        pass
+
+
+def _scan_tree(base: str, rel: str = ''):
+    """Yield ``(rel_dir, file_entries)`` for ``base`` and its subdirectories.
+
+    A lighter ``os.walk`` built on ``os.scandir``: the ``DirEntry`` objects
+    carry the file type from the directory listing, so no extra ``stat``
+    call is needed per entry.  ``rel_dir`` is relative to ``base`` (``''``
+    for ``base`` itself).
+    """
+    files = []
+    subdirs = []
+    with os.scandir(os.path.join(base, rel) if rel else base) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.is_file():
+                files.append(entry)
+    yield rel, files
+    for name in subdirs:
+        yield from _scan_tree(base, os.path.join(rel, name) if rel else name)
+
+
+@lru_cache(maxsize=4096)
+def _safe_path_component(name: str) -> str:
+    """``secure_filename`` for a directory name, ``'unnamed'`` when empty.
+
+    Memoised because the same type and ancestor names are sanitised over
+    and over while attachments of a hierarchy are copied.
+    """
+    return secure_filename(name) or 'unnamed'
+
+
+# Raster formats accepted for component, node and type images.
+_ALLOWED_IMAGE_EXT = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.bmp'})
+
+
+def _allowed_image(filename: str) -> bool:
+    """Return True when *filename* has an accepted image extension."""
+    return os.path.splitext(filename)[1].lower() in _ALLOWED_IMAGE_EXT
+
+
+# Names of a structure node and its ancestors, root first.  A recursive CTE
+# walks ``parent_id`` inside SQLite so the whole path costs one query instead
+# of a lazy load per ancestor.  The depth guard stops a corrupted
+# (cyclic) hierarchy from recursing forever.
+_ANCESTOR_NAMES_SQL = """
+    WITH RECURSIVE anc(id, parent_id, name, depth) AS (
+        SELECT id, parent_id, name, 0 FROM structures WHERE id = :id
+        UNION ALL
+        SELECT s.id, s.parent_id, s.name, anc.depth + 1
+        FROM structures AS s JOIN anc ON s.id = anc.parent_id
+        WHERE anc.depth < 1000
+    )
+    SELECT name FROM anc ORDER BY depth DESC
+"""
+
+
+def _ancestor_names(struct_obj: Structure) -> list[str]:
+    """Return the names from the root of ``struct_obj``'s hierarchy down to it."""
+    if struct_obj.id is None:
+        # Pending node not yet flushed: walk the in-memory relationship.
+        names = []
+        node = struct_obj
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        names.reverse()
+        return names
+    from sqlalchemy import text
+    return list(db.session.execute(text(_ANCESTOR_NAMES_SQL), {'id': struct_obj.id}).scalars())
+
+
+class _ZipStreamSink:
+    """Write-only file object collecting the bytes ``zipfile`` produces.
+
+    It is deliberately not seekable, so ``zipfile.ZipFile`` writes each
+    member with a trailing data descriptor instead of seeking back to patch
+    the local header.  :func:`_stream_zip` drains the buffer after every
+    chunk, which keeps memory bounded regardless of the archive size.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# Attachments that are already compressed: deflating them again costs CPU
+# time for next to no gain, so they are stored as-is in backup archives.
+_STORED_EXTENSIONS = frozenset({
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.pdf', '.zip', '.gz', '.7z',
+    '.rar', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.mp4', '.mov',
+})
+
+
+def _stream_zip(members):
+    """Yield a ZIP archive of ``members`` chunk by chunk.
+
+    ``members`` is an iterable of ``(abs_path, arcname)`` pairs.  Files are
+    read straight from their location in 1 MiB blocks, so nothing is staged
+    on disk and at most one compressed block is held in memory.  Files that
+    cannot be opened are skipped, as the previous staging copy did.
+    Already-compressed formats (see ``_STORED_EXTENSIONS``) are stored; the
+    rest, including the database, is deflated at level 1 on Python 3.13 and
+    later, which is several times faster than the default level for a
+    slightly larger archive.
+    """
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for abs_path, arcname in members:
+            try:
+                src = open(abs_path, 'rb')
+            except OSError:
+                continue
+            with src:
+                zinfo = zipfile.ZipInfo.from_file(abs_path, arcname)
+                if os.path.splitext(arcname)[1].lower() in _STORED_EXTENSIONS:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    # ZipFile.open() takes the level from the member rather
+                    # than the archive; it is public from Python 3.13 on,
+                    # older versions use zlib's default level.
+                    if hasattr(zinfo, 'compress_level'):
+                        zinfo.compress_level = zf.compresslevel
+                with zf.open(zinfo, 'w') as dst:
+                    while True:
+                        block = src.read(_COPY_BUFSIZE)
+                        if not block:
+                            break
+                        dst.write(block)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory written when the archive is closed
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _uploads_by_struct(upload_dir: str) -> dict:
+    """Return the ``sn_<id>_`` uploads grouped by structure id.
+
+    ``static/uploads`` is scanned once per request and the result kept on
+    ``flask.g``, so looking up the attachments of many structure nodes
+    (bulk imports, copies along a hierarchy) costs a dictionary lookup
+    instead of a full directory listing per node.  Views that write
+    ``sn_`` files call :func:`_invalidate_uploads_index` so later lookups
+    in the same request see the change.
+    """
+    index = getattr(g, '_uploads_by_struct', None)
+    if index is not None:
+        return index
+    index = defaultdict(list)
+    try:
+        with os.scandir(upload_dir) as it:
+            for entry in it:
+                name = entry.name
+                if not name.startswith('sn_'):
+                    continue
+                sid, sep, _rest = name[3:].partition('_')
+                if sep and sid.isdigit():
+                    index[int(sid)].append(name)
+    except OSError:
+        pass
+    g._uploads_by_struct = index
+    return index
+
+
+def _first_upload(upload_dir: str, prefix: str):
+    """Return the name of the first file in ``upload_dir`` starting with ``prefix``.
+
+    Used for the ``st_``/``cm_`` prefixes that are not covered by
+    :func:`_uploads_by_struct`.  ``glob`` matches the pattern against the
+    directory listing with a compiled regular expression and stops at the
+    first hit instead of testing every name with ``startswith`` in Python.
+    """
+    pattern = os.path.join(glob.escape(upload_dir), glob.escape(prefix) + '*')
+    path = next(glob.iglob(pattern), None)
+    return os.path.basename(path) if path else None
+
+
+def _invalidate_uploads_index() -> None:
+    """Drop the per-request upload index built by :func:`_uploads_by_struct`."""
+    g.pop('_uploads_by_struct', None)
+
+
+# Form fields that make a defaults POST an attribute update rather than a
+# documents-only (or compatibility-only) submission.  The stock threshold and
+# replenishment quantity are included so that a POST containing only these
+# values is still processed as an attribute update; the node page also has
+# quantity, lot and sales flags.
+_TYPE_ATTRIBUTE_KEYS = frozenset({
+    'description', 'weight', 'work_phase_id', 'processing_type', 'supplier_id',
+    'work_center_id', 'standard_time', 'lead_time_theoretical', 'lead_time_real',
+    'processing_cost', 'price_per_unit', 'minimum_order_qty',
+    'stock_threshold', 'replenishment_qty',
+})
+_NODE_ATTRIBUTE_KEYS = _TYPE_ATTRIBUTE_KEYS | {'quantity', 'lot_management', 'is_sellable', 'guiding_part'}
+
+# Fields of an additional processing cycle, in the order they are stored in
+# the ``cycles`` list of the notes JSON.
+_CYCLE_KEYS = (
+    'work_phase_id', 'processing_type', 'supplier_id', 'work_center_id',
+    'standard_time', 'lead_time_theoretical', 'lead_time_real', 'processing_cost',
+)
+
+
+@dataclass(slots=True)
+class _DefaultsComponent:
+    """Stand-in for a ``ProductComponent`` on the defaults pages.
+
+    ``products/component_detail.html`` renders the defaults of a structure
+    type or node through the same attributes as a real component.  Fields
+    the views do not fill keep the values an unsaved component would show.
+    """
+    structure: object = None
+    quantity: int = 1
+    description: str = ''
+    notes: str = ''
+    weight: float | None = None
+    work_phase_id: int | None = None
+    processing_type: str | None = None
+    supplier_id: int | None = None
+    work_center_id: int | None = None
+    standard_time: float | None = None
+    lead_time_theoretical: float | None = None
+    lead_time_real: float | None = None
+    processing_cost: float | None = None
+    price_per_unit: float | None = None
+    minimum_order_qty: int | None = None
+    stock_threshold: int | None = None
+    replenishment_qty: int | None = None
+    is_sellable: bool = False
+    guiding_part: bool = False
+    image_filename: str | None = None
+    created_at: object = None
+    updated_at: object = None
+    work_center: object = None
+
+
+# Document tables of the defaults pages, by category ('part', 'assembly' or
+# 'commercial'): the upload form field -> folder mapping, the folders listed
+# on the page and the folder labels shown by the template.
+_DOC_FIELDS_BY_CATEGORY = {
+    'part': {
+        'part_qualita': 'qualita',
+        'part_3_1_materiale': '3_1_materiale',
+        'part_step_tavole': 'step_tavole',
+        'part_altro': 'altro',
+    },
+    'assembly': {
+        'ass_qualita': 'qualita',
+        'ass_step_tavole': 'step_tavole',
+        'ass_funzionamento': 'funzionamento',
+        'ass_istruzioni': 'istruzioni',
+        'ass_altro': 'altro',
+    },
+    'commercial': {
+        'comm_qualita': 'qualita',
+        'comm_ddt_fornitore': 'ddt_fornitore',
+        'comm_step_tavole': 'step_tavole',
+        'comm_3_1_materiale': '3_1_materiale',
+        'comm_altro': 'altro',
+    },
+}
+_DOC_FOLDERS_BY_CATEGORY = {
+    'part': ('qualita', '3_1_materiale', 'step_tavole', 'altro'),
+    'assembly': ('qualita', 'step_tavole', 'funzionamento', 'istruzioni', 'altro'),
+    'commercial': ('qualita', 'ddt_fornitore', 'step_tavole', '3_1_materiale', 'altro'),
+}
+_DOC_LABEL_MAP = {
+    'qualita': 'Modulo Cert. qualità',
+    '3_1_materiale': '3.1 Materiale',
+    'step_tavole': 'Step/tavola',
+    'funzionamento': 'Verifica funzionamento',
+    'istruzioni': 'Montaggio istruzioni',
+    'ddt_fornitore': 'DDT fornitore',
+    'altro': 'Altro',
+}
+
+
+def _flagged_doc_sets(raw_paths):
+    """Return ``(paths, filenames, basenames)`` for the checklist-flagged documents.
+
+    ``raw_paths`` is a value of :func:`load_checklist`, whose paths are
+    already normalised to forward slashes.  File names are lower-cased;
+    base names additionally drop the extension and any ``_compiled_``
+    suffix so that compiled copies match their original document.
+    """
+    paths: set[str] = set(raw_paths)
+    filenames: set[str] = set()
+    basenames: set[str] = set()
+    for norm in paths:
+        tail = norm.rpartition('/')[2].lower()
+        filenames.add(tail)
+        base = tail.rpartition('.')[0] if '.' in tail else tail
+        base = base.partition('_compiled_')[0]
+        if base:
+            basenames.add(base)
+    return paths, filenames, basenames
+
+
+def _opt_float(value, scale: float = 1.0):
+    """Return ``float(value) * scale``, or ``None`` when ``value`` is blank or invalid.
+
+    Used for the numeric fields of the defaults forms; ``scale`` converts
+    hours (60) or days (1440) to the minutes stored on the models.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        return float(value) * scale
+    except (TypeError, ValueError):
+        return None
+
+
+# Supplier, work centre and work phase choices of the component forms.  The
+# dictionary tables change only through the dictionary pages and a database
+# reset or restore, which call ``_invalidate_catalog``; the version number is
+# part of the cache key so those writes make the next page load re-query.
+# The version only counts writes made by this process, so the key also holds
+# a time bucket: changes made through another worker show up within
+# ``_CATALOG_TTL`` seconds.
+_catalog_version = 0
+_CATALOG_TTL = 60
+
+
+@lru_cache(maxsize=4)
+def _catalog_choices(version: int, bucket: int, db_url: str) -> tuple:
+    """Return ``(suppliers, work_centers, work_phases)`` ordered by name.
+
+    Rows carry ``id`` and ``name`` (plus ``hourly_cost`` for work centres),
+    which is all the select boxes of ``component_detail.html`` read.  They
+    are plain tuples rather than ORM objects so they can be shared between
+    requests.  ``db_url`` keeps applications bound to different databases
+    apart.
+    """
+    suppliers = tuple(
+        db.session.query(Supplier.id, Supplier.name).order_by(Supplier.name.asc()).all()
+    )
+    work_centers = tuple(
+        db.session.query(WorkCenter.id, WorkCenter.name, WorkCenter.hourly_cost)
+        .order_by(WorkCenter.name.asc()).all()
+    )
+    work_phases = tuple(
+        db.session.query(WorkPhase.id, WorkPhase.name).order_by(WorkPhase.name.asc()).all()
+    )
+    return suppliers, work_centers, work_phases
+
+
+def _catalog() -> tuple:
+    """Cached :func:`_catalog_choices` for the current database."""
+    bucket = int(time.monotonic() // _CATALOG_TTL)
+    return _catalog_choices(_catalog_version, bucket, str(db.engine.url))
+
+
+def _invalidate_catalog() -> None:
+    """Make the next :func:`_catalog` call reload the dictionary tables."""
+    global _catalog_version
+    _catalog_version += 1
+
+
+def _work_center(wc_id):
+    """Return the ``WorkCenter`` with ``wc_id`` (or ``None``), memoised per request.
+
+    The cost computations of the defaults pages look up the work centre of
+    the primary cycle and of every additional cycle, often the same few
+    rows; ids that do not exist are remembered as well.
+    """
+    if not wc_id:
+        return None
+    cache = g.setdefault('_work_centers', {})
+    key = int(wc_id)
+    if key not in cache:
+        cache[key] = db.session.get(WorkCenter, key)
+    return cache[key]
+
+
+def _prefetch_work_centers(primary_id, cycles) -> None:
+    """Load the work centres of a primary cycle and its ``cycles`` in one query.
+
+    Fills the cache used by :func:`_work_center` with a single ``IN`` query
+    for the primary work centre and those of the internal additional
+    cycles, so the cost loops that follow do not query once per cycle.
+    """
+    ids = set()
+    for wc_id in [primary_id] + [c.get('work_center_id') for c in cycles or ()
+                                 if isinstance(c, dict) and c.get('processing_type') == 'internal']:
+        try:
+            if wc_id:
+                ids.add(int(wc_id))
+        except (TypeError, ValueError):
+            pass
+    cache = g.setdefault('_work_centers', {})
+    missing = ids.difference(cache)
+    if not missing:
+        return
+    found = {wc.id: wc for wc in WorkCenter.query.filter(WorkCenter.id.in_(missing))}
+    for wc_id in missing:
+        cache[wc_id] = found.get(wc_id)
+
+
+def _aggregated_cost(primary_type, primary_hours, primary_wc_id, cycles):
+    """Return the total processing cost of a primary cycle and its additional cycles.
+
+    Internal cycles cost their standard time (hours) times the hourly cost
+    of their work centre; external additional cycles add their own
+    ``processing_cost``.  Returns ``None`` when the total is not positive.
+    Invalid values in a cycle are skipped.
+    """
+    total_cost = 0.0
+    # Load every work centre used by the cycles with one query
+    _prefetch_work_centers(primary_wc_id, cycles)
+    # Primary cycle cost (internal only)
+    if primary_type == 'internal' and primary_hours is not None and primary_wc_id:
+        wc_obj = _work_center(primary_wc_id)
+        if wc_obj and wc_obj.hourly_cost is not None:
+            try:
+                total_cost += primary_hours * float(wc_obj.hourly_cost)
+            except Exception:
+                pass
+    # Additional cycles cost
+    for cycle in cycles or ():
+        try:
+            ctype = cycle.get('processing_type')
+            if ctype == 'internal':
+                st_hours = cycle.get('standard_time')
+                wc_id = cycle.get('work_center_id')
+                if st_hours and wc_id:
+                    try:
+                        std_h = float(st_hours)
+                        wc_obj = _work_center(wc_id)
+                        if wc_obj and wc_obj.hourly_cost is not None:
+                            total_cost += std_h * float(wc_obj.hourly_cost)
+                    except Exception:
+                        pass
+            elif ctype == 'external':
+                cost_str = cycle.get('processing_cost')
+                if cost_str:
+                    try:
+                        total_cost += float(cost_str)
+                    except (ValueError, TypeError):
+                        pass
+        except Exception:
+            pass
+    return total_cost if total_cost > 0 else None
+
+
+# Master attributes copied onto a structure node after its defaults are saved.
+_MASTER_MIRROR_FIELDS = (
+    'description', 'weight', 'processing_type', 'work_phase_id', 'supplier_id',
+    'work_center_id', 'standard_time', 'lead_time_theoretical', 'lead_time_real',
+    'processing_cost', 'price_per_unit', 'minimum_order_qty', 'notes',
+)
+
+# Product id in a ``return_to`` URL pointing at a product page.
+_PRODUCT_ID_RE = re.compile(r"/products/(\d+)")
+
+
+def _update_node_components(struct_id: int, pc_id, return_to, values: dict) -> int:
+    """Apply ``values`` to the product components edited from a node's defaults page.
+
+    ``pc_id`` targets that product component and a ``return_to`` URL of a
+    product page targets the node's component in that product.  Without such
+    a context, or when the targeted component does not exist, every component
+    referencing the node is updated.  Each case is a single UPDATE statement
+    instead of loading and modifying the rows one by one.  Returns the number
+    of rows updated.
+    """
+    query = None
+    if pc_id:
+        try:
+            query = ProductComponent.query.filter_by(id=int(pc_id))
+        except (TypeError, ValueError):
+            query = None
+    elif return_to:
+        m_prod = _PRODUCT_ID_RE.search(return_to)
+        if m_prod:
+            query = ProductComponent.query.filter_by(product_id=int(m_prod.group(1)), structure_id=struct_id)
+    if query is not None:
+        count = query.update(values, synchronize_session=False)
+        if count:
+            return count
+    return ProductComponent.query.filter_by(structure_id=struct_id).update(values, synchronize_session=False)
+
+
+def _nodes_by_type(types) -> dict:
+    """Return ``{type_id: nodes ordered by name}`` for ``types``.
+
+    All nodes are read with one query and grouped in Python instead of one
+    query per type through the dynamic ``StructureType.nodes`` relationship.
+    """
+    nodes_by_type = {t.id: [] for t in types}
+    for node in Structure.query.order_by(Structure.name.asc()):
+        bucket = nodes_by_type.get(node.type_id)
+        if bucket is not None:
+            bucket.append(node)
+    return nodes_by_type
+
+
 def _copy_attachments_to_master(struct_obj: Structure, master_obj: ComponentMaster):
     """Copy images and document folders from a structure node to its master.
 
@@ -43,64 +632,120 @@ def _copy_attachments_to_master(struct_obj: Structure, master_obj: ComponentMast
     name.  Existing files in the destination are preserved.
     """
     try:
-        # Copy images
-        upload_dir = os.path.join(current_app.static_folder, 'uploads')
-        if os.path.isdir(upload_dir):
-            prefix_src = f"sn_{struct_obj.id}_"
-            for fname in os.listdir(upload_dir):
-                if fname.startswith(prefix_src):
-                    suffix = fname[len(prefix_src):]
-                    dest_name = f"cm_{master_obj.id}_{suffix}"
-                    src_path = os.path.join(upload_dir, fname)
-                    dest_path = os.path.join(upload_dir, dest_name)
-                    try:
-                        if not os.path.exists(dest_path):
-                            shutil.copyfile(src_path, dest_path)
-                    except Exception:
-                        pass
-        # Copy documents
-        # Build source path using the original tmp_structures hierarchy
-        def _safe(n: str) -> str:
-            return secure_filename(n) or 'unnamed'
+        plan = _master_copy_plan(struct_obj, master_obj)
+        upload_dir = plan[0]
+        _copy_master_files(*plan, image_names=_uploads_by_struct(upload_dir).get(struct_obj.id, ()))
+    except Exception:
+        # Fail silently on any error
+        pass
+
+
+def _master_copy_plan(struct_obj: Structure, master_obj: ComponentMaster) -> tuple:
+    """Resolve the paths used by :func:`_copy_master_files` for a node and its master.
+
+    Returns ``(upload_dir, struct_id, master_id, src_base, dest_base)``: plain
+    values only, so the copy itself can run outside the request (see
+    :func:`_replicate_node_files`).
+    """
+    upload_dir = os.path.join(current_app.static_folder, 'uploads')
+    # Build source path using the original tmp_structures hierarchy
+    _safe = _safe_path_component
+    try:
+        type_dir = _safe(struct_obj.type.name)
+    except Exception:
+        type_dir = 'unknown'
+    # Reuse the path computed by an earlier call for the same node (the
+    # helper runs several times per node during imports and bulk edits).
+    path_key = (struct_obj.parent_id, struct_obj.name)
+    cached = getattr(struct_obj, '_path_parts', None)
+    if cached is not None and cached[0] == path_key:
+        parts = cached[1]
+    else:
+        parts = [_safe(name) for name in _ancestor_names(struct_obj)]
+        struct_obj._path_parts = (path_key, parts)
+    src_base = os.path.join(current_app.static_folder, 'tmp_structures', type_dir, *parts)
+    dest_base = os.path.join(current_app.static_folder, 'tmp_components', _safe(master_obj.code))
+    return upload_dir, struct_obj.id, master_obj.id, src_base, dest_base
+
+
+def _copy_master_files(upload_dir, struct_id, master_id, src_base, dest_base, image_names=None):
+    """Copy a node's images and documents to its master (file work only).
+
+    ``image_names`` lists the node's ``sn_<struct_id>_`` uploads; when
+    omitted the upload directory is scanned for them.
+    """
+    # Copy images
+    if os.path.isdir(upload_dir):
+        prefix_src = f"sn_{struct_id}_"
+        if image_names is None:
+            with os.scandir(upload_dir) as it:
+                image_names = [e.name for e in it if e.name.startswith(prefix_src)]
+        for fname in image_names:
+            suffix = fname[len(prefix_src):]
+            dest_name = f"cm_{master_id}_{suffix}"
+            src_path = os.path.join(upload_dir, fname)
+            dest_path = os.path.join(upload_dir, dest_name)
+            _copy_if_missing((src_path, dest_path))
+    # Copy documents
+    if os.path.isdir(src_base):
         try:
-            type_dir = _safe(struct_obj.type.name)
+            # Create destination directory if it does not exist
+            os.makedirs(dest_base, exist_ok=True)
         except Exception:
-            type_dir = 'unknown'
-        parts: list[str] = []
-        def _collect(node_obj):
-            if node_obj.parent:
-                _collect(node_obj.parent)
-            parts.append(_safe(node_obj.name))
-        _collect(struct_obj)
-        src_base = os.path.join(current_app.static_folder, 'tmp_structures', type_dir, *parts)
-        if os.path.isdir(src_base):
-            dest_base = os.path.join(current_app.static_folder, 'tmp_components', _safe(master_obj.code))
+            pass
+        # Recreate the subdirectories first and collect the files to copy,
+        # then copy them on a small thread pool: the copies are I/O bound
+        # and the GIL is released inside the copy system calls.
+        pairs = []
+        for rel, file_entries in _scan_tree(src_base):
+            dest_root = os.path.join(dest_base, rel) if rel else dest_base
             try:
-                # Create destination directory if it does not exist
-                os.makedirs(dest_base, exist_ok=True)
+                os.makedirs(dest_root, exist_ok=True)
             except Exception:
                 pass
-            # Copy each subdirectory and file into the destination preserving structure
-            for root, dirs, files in os.walk(src_base):
-                rel = os.path.relpath(root, src_base)
-                dest_root = os.path.join(dest_base, rel) if rel != '.' else dest_base
-                try:
-                    os.makedirs(dest_root, exist_ok=True)
-                except Exception:
-                    pass
-                for f in files:
-                    src_file = os.path.join(root, f)
-                    dest_file = os.path.join(dest_root, f)
-                    try:
-                        if not os.path.exists(dest_file):
-                            shutil.copyfile(src_file, dest_file)
-                    except Exception:
-                        pass
-    except Exception:
-        # Fail silently on any error
-        pass
+            for entry in file_entries:
+                pairs.append((entry.path, os.path.join(dest_root, entry.name)))
+        if len(pairs) > 1:
+            with ThreadPoolExecutor(max_workers=min(_COPY_WORKERS, len(pairs))) as pool:
+                list(pool.map(_copy_if_missing, pairs))
+        else:
+            for pair in pairs:
+                _copy_if_missing(pair)
+
+
+# Background workers for the file replication done when a structure node is
+# created: the copies run after the response has been sent instead of
+# holding the request until every byte is written.
+_replication_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='node-files')
+
 
-def ensure_component_master_for_structure(struct_obj: Structure) -> ComponentMaster:
+def _replicate_node_files(docs_pair=None, master_plan=None) -> None:
+    """Copy a new node's inherited documents, then mirror its files to its master.
+
+    Runs on ``_replication_pool`` and receives only paths and ids (no ORM
+    objects or app context).  ``docs_pair`` is the ``(src, dst)`` pair of
+    document directories inherited from a node with the same code and
+    ``master_plan`` the arguments of :func:`_copy_master_files`.  The
+    inherited image is copied by the view itself before it redirects.
+    """
+    if docs_pair:
+        base_src, base_dst = docs_pair
+        try:
+            # The node is new, so its folder holds nothing to replace; merge
+            # into it and keep any file uploaded while this job was queued.
+            if os.path.isdir(base_src):
+                shutil.copytree(base_src, base_dst, dirs_exist_ok=True,
+                                copy_function=lambda src, dst: _copy_if_missing((src, dst)))
+        except Exception:
+            pass
+    if master_plan:
+        try:
+            _copy_master_files(*master_plan)
+        except Exception:
+            pass
+
+
+def ensure_component_master_for_structure(struct_obj: Structure, commit: bool = True) -> ComponentMaster:
     """Ensure that a given structure has an associated ComponentMaster.
 
     This function looks up a master record by the structure name (treated as
@@ -109,6 +754,10 @@ def ensure_component_master_for_structure(struct_obj: Structure) -> ComponentMas
     ``component_id`` is updated to reference the master.  Attachments (images
     and documents) are copied from the structure directories into the master
     directories.  The function returns the master record.
+
+    With ``commit=False`` the changes are only flushed and the attachments
+    are not copied: the caller commits its own transaction and then calls
+    :func:`_copy_attachments_to_master` itself.
     """
     if not struct_obj:
         return None
@@ -116,7 +765,8 @@ def ensure_component_master_for_structure(struct_obj: Structure) -> ComponentMas
     code = (struct_obj.name or '').strip()
     if not code:
         return None
-    # Search for existing master
+    # Search for existing master.  ``code`` is declared unique, so SQLite
+    # answers this from the index backing the UNIQUE constraint.
     master = ComponentMaster.query.filter_by(code=code).first()
     created = False
     if not master:
@@ -139,15 +789,24 @@ def ensure_component_master_for_structure(struct_obj: Structure) -> ComponentMas
         master.minimum_order_qty = struct_obj.minimum_order_qty
         # cycles_json and type_of_processing are left None unless set via custom logic
         db.session.add(master)
-        db.session.commit()
+        # Flush to obtain the primary key; the insert is committed together
+        # with the structure update below in a single transaction.
+        db.session.flush()
         created = True
     # Assign the structure's component_id if not already assigned
     if struct_obj.component_id != master.id:
         struct_obj.component_id = master.id
-        try:
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
+        if not commit:
+            db.session.flush()
+        elif not created:
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+    if not commit:
+        return master
+    if created:
+        db.session.commit()
     # Copy attachments if the master was newly created or if the structure's
     # attachments are newer.  We copy unconditionally to simplify logic.
     _copy_attachments_to_master(struct_obj, master)
@@ -167,15 +826,55 @@ admin_bp = Blueprint('admin', __name__, template_folder='../../templates')
 # we inspect the current schema of each table and conditionally add the
 # stock_threshold and replenishment_qty columns for the relevant tables.
 
+# Serialises the first run of ``_ensure_inventory_columns`` between the
+# threads of a worker.
+_inventory_columns_lock = threading.Lock()
+
+
 def _ensure_inventory_columns() -> None:
-    """Add inventory-related columns to tables if they do not exist."""
+    """Add inventory-related columns to tables if they do not exist.
+
+    The schema does not change while the process runs, so the check is done
+    once per application: after the first successful pass a flag is set on
+    the app object and later calls return immediately without touching the
+    database.  ``create_app`` runs it at start-up together with the other
+    schema upgrades, so the views normally only see the flag.
+    """
+    if getattr(current_app, '_inventory_columns_checked', False):
+        return
+    with _inventory_columns_lock:
+        if getattr(current_app, '_inventory_columns_checked', False):
+            return
+        _add_inventory_columns()
+
+
+def _add_inventory_columns() -> None:
+    """Run the column checks of :func:`_ensure_inventory_columns` (unguarded)."""
     try:
         # Import here to avoid circular import issues when Flask initializes
-        from sqlalchemy import text
+        from sqlalchemy import text, inspect
         conn = db.engine.connect()
+        is_sqlite = conn.dialect.name == 'sqlite'
+        tables = ('structure_types', 'structures', 'product_components', 'component_masters')
+        cols: dict[str, set[str]] = defaultdict(set)
+        if is_sqlite:
+            # Read the columns of all four tables with a single introspection
+            # query instead of one ``PRAGMA table_info`` round-trip per table.
+            rows = conn.execute(text(
+                "SELECT m.name AS tbl, p.name AS col "
+                "FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p "
+                "WHERE m.type = 'table' AND m.name IN "
+                "('structure_types', 'structures', 'product_components', 'component_masters')"
+            )).fetchall()
+            for tbl, col in rows:
+                cols[tbl].add(col)
+        else:
+            insp = inspect(conn)
+            for tbl in tables:
+                if insp.has_table(tbl):
+                    cols[tbl] = {c['name'] for c in insp.get_columns(tbl)}
         # structure_types table: add default_stock_threshold and default_replenishment_qty
-        res = conn.execute(text('PRAGMA table_info(structure_types)')).fetchall()
-        col_names = [row[1] for row in res]
+        col_names = cols['structure_types']
         if 'default_stock_threshold' not in col_names:
             conn.execute(text('ALTER TABLE structure_types ADD COLUMN default_stock_threshold FLOAT'))
         if 'default_replenishment_qty' not in col_names:
@@ -185,8 +884,7 @@ def _ensure_inventory_columns() -> None:
         # comma‑separated list of revision labels selected as compatible when
         # revising a structure.  It is added dynamically to ensure older
         # databases remain backwards compatible.
-        res2 = conn.execute(text('PRAGMA table_info(structures)')).fetchall()
-        col2 = [row[1] for row in res2]
+        col2 = cols['structures']
         # Add inventory stock and replenishment fields when missing
         if 'stock_threshold' not in col2:
             conn.execute(text('ALTER TABLE structures ADD COLUMN stock_threshold FLOAT'))
@@ -198,8 +896,18 @@ def _ensure_inventory_columns() -> None:
         # string until the first revision is made.  This dynamic
         # migration enables backwards compatibility with databases
         # created before the revision feature was introduced.
+        #
+        # SQLite stores the DEFAULT in the schema only, so the ALTER stays a
+        # metadata change.  Other engines may rewrite the whole table for an
+        # ADD COLUMN ... DEFAULT, so there the column is added as nullable
+        # and existing rows are backfilled with a plain UPDATE (new rows get
+        # 0 from the model default).
         if 'revision' not in col2:
-            conn.execute(text('ALTER TABLE structures ADD COLUMN revision INTEGER DEFAULT 0'))
+            if is_sqlite:
+                conn.execute(text('ALTER TABLE structures ADD COLUMN revision INTEGER DEFAULT 0'))
+            else:
+                conn.execute(text('ALTER TABLE structures ADD COLUMN revision INTEGER NULL'))
+                conn.execute(text('UPDATE structures SET revision = 0 WHERE revision IS NULL'))
         # Add the compatible_revisions column when absent.  This column
         # stores a comma‑separated list of revision labels (e.g. "Rev.A,Rev.B")
         # indicating which prior versions remain compatible after a
@@ -207,20 +915,20 @@ def _ensure_inventory_columns() -> None:
         if 'compatible_revisions' not in col2:
             conn.execute(text('ALTER TABLE structures ADD COLUMN compatible_revisions TEXT'))
         # product_components table: add stock_threshold and replenishment_qty
-        res3 = conn.execute(text('PRAGMA table_info(product_components)')).fetchall()
-        col3 = [row[1] for row in res3]
+        col3 = cols['product_components']
         if 'stock_threshold' not in col3:
             conn.execute(text('ALTER TABLE product_components ADD COLUMN stock_threshold FLOAT'))
         if 'replenishment_qty' not in col3:
             conn.execute(text('ALTER TABLE product_components ADD COLUMN replenishment_qty FLOAT'))
         # component_masters table: add stock_threshold and replenishment_qty
-        res4 = conn.execute(text('PRAGMA table_info(component_masters)')).fetchall()
-        col4 = [row[1] for row in res4]
+        col4 = cols['component_masters']
         if 'stock_threshold' not in col4:
             conn.execute(text('ALTER TABLE component_masters ADD COLUMN stock_threshold FLOAT'))
         if 'replenishment_qty' not in col4:
             conn.execute(text('ALTER TABLE component_masters ADD COLUMN replenishment_qty FLOAT'))
+        conn.commit()
         conn.close()
+        current_app._inventory_columns_checked = True
     except Exception:
         # Silently ignore any errors during schema upgrades.  In production,
         # logging would be appropriate to detect issues.
@@ -232,10 +940,21 @@ def admin_required():
     This helper raises a 403 error when a non‑admin user attempts to access an
     administrative route.  It does not handle redirecting anonymous users
     because Flask‑Login's `login_required` decorator takes care of that.
+    The result computed by :func:`check_admin` is reused from ``flask.g`` so
+    views calling this helper do not resolve the user's role again.
     """
-    if not current_user.is_authenticated or not getattr(current_user, 'is_admin', False):
+    is_admin = g.get('_is_admin')
+    if is_admin is None:
+        is_admin = _remember_is_admin()
+    if not is_admin:
         abort(403)
 
+
+def _remember_is_admin() -> bool:
+    """Compute whether the current user is an admin and store it on ``flask.g``."""
+    g._is_admin = bool(current_user.is_authenticated and getattr(current_user, 'is_admin', False))
+    return g._is_admin
+
 @admin_bp.before_request
 def check_admin():
     """Protect all admin routes so that only authenticated admin users may access them.
@@ -249,7 +968,7 @@ def check_admin():
     if not current_user.is_authenticated:
         # Delegate to Flask‑Login for redirect behaviour
         return login_manager.unauthorized()
-    if not current_user.is_admin:
+    if not _remember_is_admin():
         abort(403)
 
 @admin_bp.route('/')
@@ -258,6 +977,9 @@ def index():
     admin_required()
     return render_template('admin/index.html')
 
+# Lifetime in seconds of the ``ADMIN_MODULES`` snapshot used by ``modules``.
+_ADMIN_MODULES_TTL = 300
+
 @admin_bp.route('/modules', methods=['GET', 'POST'])
 @login_required
 def modules():
@@ -275,7 +997,21 @@ def modules():
             flash(f'Modulo "{m.name}": {"abilitato" if m.enabled else "disabilitato"}', 'success')
         return redirect(url_for('admin.modules'))
 
-    modules = Module.query.order_by(Module.name.asc()).all()
+    # Modules change rarely: serve the list from the per-process snapshot in
+    # ``app.config``.  The ``Module`` mapper events registered in the ``app``
+    # package clear it whenever a row is written, so the toggle above is
+    # reflected on the next render.  Those events only fire in this process,
+    # so the snapshot also expires after ``_ADMIN_MODULES_TTL`` seconds and
+    # toggles made through another worker show up within that.
+    modules = current_app.config.get('ADMIN_MODULES')
+    now = time.monotonic()
+    if modules is None or now - current_app.config.get('ADMIN_MODULES_LOADED_AT', 0) >= _ADMIN_MODULES_TTL:
+        modules = current_app.config['ADMIN_MODULES'] = tuple(
+            db.session.query(Module.id, Module.name, Module.endpoint, Module.enabled)
+            .order_by(Module.name.asc())
+            .all()
+        )
+        current_app.config['ADMIN_MODULES_LOADED_AT'] = now
     return render_template('admin/modules.html', modules=modules)
 
 
@@ -306,7 +1042,9 @@ def reset_db():
     # Delete database records
     try:
         # Remove dependent records in an order that avoids foreign key conflicts.
-        # Use session-level deletes to ensure cascades are honored.
+        # Each table is emptied with a single Core ``DELETE`` so no rows are
+        # loaded into the session, and all statements share one transaction
+        # committed at the end.
         # Define the models to purge.  This list includes all tables that
         # store inventory, registry and build data.  Exclude User and Module
         # models so that admin accounts and module settings persist.
@@ -328,16 +1066,9 @@ def reset_db():
             # Custom field definitions and values last
             ComponentFieldValue, TypeField, CustomValue, CustomField
         ]:
-            try:
-                db.session.query(model).delete(synchronize_session=False)
-            except Exception:
-                # Fallback: iterate individual objects for deletion
-                for obj in model.query.all():
-                    try:
-                        db.session.delete(obj)
-                    except Exception:
-                        pass
+            db.session.execute(model.__table__.delete())
         db.session.commit()
+        _invalidate_catalog()
     except Exception:
         db.session.rollback()
         flash('Errore durante la cancellazione dei dati.', 'danger')
@@ -346,15 +1077,16 @@ def reset_db():
     try:
         upload_dir = os.path.join(current_app.static_folder, 'uploads')
         if os.path.isdir(upload_dir):
-            for fname in os.listdir(upload_dir):
-                # Skip known assets (if any) by extension; remove all others
-                if fname.lower().startswith('logo') or fname.lower().startswith('favicon'):
-                    continue
-                fpath = os.path.join(upload_dir, fname)
-                try:
-                    os.remove(fpath)
-                except Exception:
-                    pass
+            with os.scandir(upload_dir) as it:
+                for entry in it:
+                    # Skip known assets (if any) by extension; remove all others
+                    lname = entry.name.lower()
+                    if lname.startswith('logo') or lname.startswith('favicon'):
+                        continue
+                    try:
+                        os.remove(entry.path)
+                    except Exception:
+                        pass
     except Exception:
         # ignore errors cleaning uploads
         pass
@@ -370,15 +1102,15 @@ def reset_db():
     try:
         docs_dir = os.path.join(current_app.static_folder, 'documents')
         if os.path.isdir(docs_dir):
-            for entry in os.listdir(docs_dir):
-                path_entry = os.path.join(docs_dir, entry)
-                try:
-                    if os.path.isdir(path_entry):
-                        shutil.rmtree(path_entry, ignore_errors=True)
-                    else:
-                        os.remove(path_entry)
-                except Exception:
-                    pass
+            with os.scandir(docs_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            shutil.rmtree(entry.path, ignore_errors=True)
+                        else:
+                            os.remove(entry.path)
+                    except Exception:
+                        pass
     except Exception:
         pass
     # Remove production archives and completed assemblies (under Produzione)
@@ -411,47 +1143,52 @@ def reset_db():
 def save_db():
     """Package the current database and attachments into a ZIP archive.
 
-    This endpoint copies the SQLite database file ``instance/app.db`` and the
-    directories ``static/uploads``, ``static/tmp_structures`` and
-    ``static/tmp_components`` into a temporary location, zips them and
-    returns the resulting archive for download.  The archive can later be
+    This endpoint streams a ZIP archive containing the SQLite database file
+    ``instance/app.db`` and the directories ``static/uploads``,
+    ``static/tmp_structures`` and ``static/tmp_components`` as a download.  The archive can later be
     imported via the update_db endpoint.  Only accessible by administrators.
     """
     admin_required()
     try:
-        # Create a temporary directory to assemble the backup
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Copy the database file
-            src_db = os.path.join(current_app.instance_path, 'app.db')
-            dest_db = os.path.join(tmpdir, 'app.db')
+        # Snapshot the database so that the archive holds a consistent copy
+        # even if a later checkpoint rewrites ``app.db`` while the response
+        # is still streaming.  The database runs in WAL mode and recent
+        # commits may still live only in ``app.db-wal``, so the file is not
+        # copied directly: SQLite's online backup API reads a consistent
+        # view of the database including the WAL, whatever the other
+        # connections are doing.  The attachments, which make up the bulk
+        # of the backup, are read straight from their directories.
+        fd, db_snapshot = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            raw = db.engine.raw_connection()
             try:
-                shutil.copyfile(src_db, dest_db)
-            except Exception:
-                # If copy fails, still proceed but warn user
-                pass
-            # Copy attachments directories
-            static_base = current_app.static_folder
-            for sub in ['uploads', 'tmp_structures', 'tmp_components']:
-                src = os.path.join(static_base, sub)
-                if os.path.isdir(src):
-                    dest = os.path.join(tmpdir, sub)
-                    try:
-                        shutil.copytree(src, dest, dirs_exist_ok=True)
-                    except Exception:
-                        pass
-            # Create an in-memory zip file
-            mem_file = io.BytesIO()
-            with zipfile.ZipFile(mem_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for root, dirs, files in os.walk(tmpdir):
-                    for filename in files:
-                        abs_path = os.path.join(root, filename)
-                        rel_path = os.path.relpath(abs_path, tmpdir)
-                        try:
-                            zf.write(abs_path, rel_path)
-                        except Exception:
-                            pass
-            mem_file.seek(0)
-            return send_file(mem_file, as_attachment=True, download_name='db_backup.zip', mimetype='application/zip')
+                dest = sqlite3.connect(db_snapshot)
+                try:
+                    raw.driver_connection.backup(dest)
+                finally:
+                    dest.close()
+            finally:
+                raw.close()
+        except Exception:
+            # If copy fails, still proceed without the database
+            os.remove(db_snapshot)
+            db_snapshot = None
+        members = []
+        if db_snapshot:
+            members.append((db_snapshot, 'app.db'))
+        static_base = current_app.static_folder
+        for sub in ['uploads', 'tmp_structures', 'tmp_components']:
+            src = os.path.join(static_base, sub)
+            if os.path.isdir(src):
+                for rel, file_entries in _scan_tree(src):
+                    for entry in file_entries:
+                        members.append((entry.path, os.path.join(sub, rel, entry.name)))
+        response = Response(stream_with_context(_stream_zip(members)), mimetype='application/zip')
+        response.headers['Content-Disposition'] = 'attachment; filename=db_backup.zip'
+        if db_snapshot:
+            response.call_on_close(lambda: os.path.exists(db_snapshot) and os.remove(db_snapshot))
+        return response
     except Exception:
         flash('Errore durante il salvataggio del database.', 'danger')
         return redirect(url_for('admin.modules'))
@@ -476,12 +1213,16 @@ def update_db():
         # Save the uploaded file to a temporary file
         try:
             tmp_upload = tempfile.NamedTemporaryFile(delete=False)
-            file.save(tmp_upload.name)
+            file.save(tmp_upload.name, buffer_size=_COPY_BUFSIZE)
         except Exception:
             flash('Errore durante il caricamento del file.', 'danger')
             return redirect(url_for('admin.update_db'))
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
+            # Extract next to the static folder, i.e. on the same filesystem,
+            # so the attachment directories can be swapped in with a rename
+            # instead of being copied file by file.
+            static_base = current_app.static_folder
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(static_base), prefix='.db_update_') as tmpdir:
                 # Extract the archive
                 with zipfile.ZipFile(tmp_upload.name, 'r') as zf:
                     zf.extractall(tmpdir)
@@ -489,24 +1230,78 @@ def update_db():
                 src_db = os.path.join(tmpdir, 'app.db')
                 if os.path.isfile(src_db):
                     dest_db = os.path.join(current_app.instance_path, 'app.db')
+                    fd, tmp_db = tempfile.mkstemp(dir=current_app.instance_path, prefix='.app.db.restore-')
+                    os.close(fd)
                     try:
-                        shutil.copyfile(src_db, dest_db)
+                        # Copy into a temporary file next to the database and
+                        # rename it into place: the live ``app.db`` is memory
+                        # mapped by open connections (here and in the other
+                        # workers), so it must never be truncated and
+                        # rewritten in place.
+                        _fastcopy(src_db, tmp_db)
+                        if os.path.exists(dest_db):
+                            shutil.copymode(dest_db, tmp_db)
+                        with open(tmp_db, 'rb') as fh:
+                            os.fsync(fh.fileno())
+                        # Fold the WAL into the current database and empty
+                        # it so no frames are replayed on top of the restored
+                        # file.  The ``-wal``/``-shm`` files themselves stay:
+                        # other connections may still have them open.
+                        try:
+                            from sqlalchemy import text
+                            db.session.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+                        except Exception:
+                            pass
+                        # Close the pooled connections of this process so
+                        # the next request opens the restored file.
+                        db.session.remove()
+                        db.engine.dispose()
+                        os.replace(tmp_db, dest_db)
+                        # The backup may predate columns added since; the
+                        # views no longer probe the schema per request, so
+                        # bring the restored file up to date right away.
+                        upgrade_database()
+                        current_app._inventory_columns_checked = False
+                        _ensure_inventory_columns()
+                        # The restored database may enable different modules;
+                        # drop the cached module lists so they are reloaded.
+                        current_app.config['ENABLED_MODULES'] = None
+                        _invalidate_catalog()
+                        current_app.config['ADMIN_MODULES'] = None
                     except Exception:
                         flash('Impossibile sostituire il file del database.', 'danger')
                         return redirect(url_for('admin.update_db'))
-                # Replace attachments directories
-                static_base = current_app.static_folder
+                    finally:
+                        # Only left behind when the copy or the rename failed
+                        try:
+                            os.unlink(tmp_db)
+                        except OSError:
+                            pass
+                # Replace attachments directories.  The current directory is
+                # renamed into the staging area (removed with it on exit) and
+                # the extracted one renamed into place: two renames whatever
+                # the number of files.
                 for sub in ['uploads', 'tmp_structures', 'tmp_components']:
                     src_dir = os.path.join(tmpdir, sub)
                     if os.path.isdir(src_dir):
                         dest_dir = os.path.join(static_base, sub)
+                        old_dir = os.path.join(tmpdir, sub + '.old')
                         try:
-                            # Remove existing directory if any
                             if os.path.isdir(dest_dir):
-                                shutil.rmtree(dest_dir, ignore_errors=True)
-                            shutil.copytree(src_dir, dest_dir)
+                                os.replace(dest_dir, old_dir)
+                            try:
+                                os.replace(src_dir, dest_dir)
+                            except OSError:
+                                # Staging ended up on another filesystem:
+                                # fall back to copying the files.
+                                shutil.copytree(src_dir, dest_dir, copy_function=_fastcopy)
                         except Exception:
-                            pass
+                            # Put the previous directory back if it was moved
+                            if os.path.isdir(old_dir) and not os.path.exists(dest_dir):
+                                try:
+                                    os.replace(old_dir, dest_dir)
+                                except OSError:
+                                    pass
         finally:
             # Clean up the temporary uploaded file
             try:
@@ -580,32 +1375,37 @@ def structures():
                 is_part=is_part,
                 is_commercial=is_comm
             )
-            db.session.add(st)
-            db.session.commit()
             # When a new structure type is created, also create a corresponding
             # product if one does not already exist.  This aligns the domain
             # model where each typology represents a distinct product.  The
             # product inherits the name and description from the type and
             # initialises other fields (revision, revisionabile) with default
             # values.  Avoid duplicating products when a type with the same
-            # name is created again.
+            # name is created again.  Type and product are inserted in a
+            # single transaction so the write lock is taken only once.
             try:
                 existing_product = Product.query.filter_by(name=name).first()
             except Exception:
                 existing_product = None
+            new_prod = None
             if not existing_product:
-                try:
-                    new_prod = Product(
-                        name=name,
-                        description=description,
-                        revision=1,
-                        revisionabile=False
-                    )
-                    db.session.add(new_prod)
-                    db.session.commit()
-                except Exception:
-                    # On failure (e.g. missing table) roll back the transaction but keep the type
-                    db.session.rollback()
+                new_prod = Product(
+                    name=name,
+                    description=description,
+                    revision=1,
+                    revisionabile=False
+                )
+            db.session.add_all([st, new_prod] if new_prod is not None else [st])
+            try:
+                db.session.commit()
+            except Exception:
+                # On failure (e.g. missing products table) roll back the
+                # transaction but keep the type
+                db.session.rollback()
+                if new_prod is None:
+                    raise
+                db.session.add(st)
+                db.session.commit()
             # Clear any pending form data and notify the admin
             session.pop('pending_type_form', None)
             flash('Tipo creato.', 'success')
@@ -647,7 +1447,6 @@ def structures():
                     draft.table_parte = False
                 else:
                     draft.table_commerciale = False
-                db.session.commit()
                 return draft
             # When creating a node (action = create) check for an existing draft
             if action != 'define':
@@ -658,12 +1457,41 @@ def structures():
                 # structure for the requested type/parent but copy attributes from
                 # the first non‑draft structure with the same name and typology.
                 # Draft nodes are handled separately below.
+                #
+                # All database changes below (node, copied attributes, type
+                # defaults, component master and product propagation) are
+                # committed in one transaction at the end; ``flush`` is used
+                # where the new id is needed.  File copies are planned by the
+                # ``after_commit`` callbacks once the commit succeeded, so an
+                # I/O error can never roll back the node: each callback adds
+                # the paths to copy to ``file_job``.  The inherited image is
+                # then copied inline and the remaining copies run on
+                # ``_replication_pool`` without delaying the response.
+                after_commit: list = []
+                file_job: dict = {}
+                # Load the node's structure type once; it provides the defaults
+                # applied below and the product bound to root nodes.
+                try:
+                    stype_obj = db.session.get(StructureType, int(type_id))
+                except Exception:
+                    stype_obj = None
+                # Nodes with the same name and typology, read with one query:
+                # they provide both the draft to finalise (same type and parent,
+                # draft flag set) and the canonical non-draft node whose details
+                # a new node inherits.
+                parent_id_value = int(parent_id) if parent_id else None
+                candidates = (Structure.query
+                              .filter_by(name=name, flag_assembly=flag_ass, flag_part=flag_part,
+                                         flag_commercial=flag_comm)
+                              .order_by(Structure.id.asc())
+                              .all())
                 # See if there is a draft node with same name, type and parent and typology
-                existing_draft = (Structure.query
-                                  .filter_by(name=name, type_id=int(type_id), parent_id=int(parent_id) if parent_id else None,
-                                             flag_assembly=flag_ass, flag_part=flag_part, flag_commercial=flag_comm)
-                                  .filter(getattr(Structure, draft_field) == True)
-                                  .first())
+                existing_draft = next(
+                    (c for c in candidates
+                     if c.type_id == int(type_id) and c.parent_id == parent_id_value
+                     and getattr(c, draft_field) is True),
+                    None,
+                )
                 if existing_draft:
                     # Finalize the draft instead of creating a new node
                     s = finalize_draft(existing_draft)
@@ -677,101 +1505,77 @@ def structures():
                         flag_commercial=flag_comm
                     )
                     db.session.add(s)
-                    db.session.commit()
+                    db.session.flush()
                     # After creating the new structure, copy attributes from an
                     # existing non‑draft structure with the same name and typology
                     # (if any).  This ensures that details (weight, processing,
                     # description, notes, cycles, etc.) are reused when the
                     # same code is imported into multiple types.
-                    existing_global = (Structure.query
-                                       .filter_by(name=name,
-                                                  flag_assembly=flag_ass,
-                                                  flag_part=flag_part,
-                                                  flag_commercial=flag_comm)
-                                       .filter_by(table_assieme=False,
-                                                  table_parte=False,
-                                                  table_commerciale=False)
-                                       .filter(Structure.id != s.id)
-                                       .first())
+                    existing_global = next(
+                        (c for c in candidates
+                         if (c.table_assieme, c.table_parte, c.table_commerciale) == (False, False, False)),
+                        None,
+                    )
                     if existing_global:
                         # Copy attributes that are defined on the canonical structure to the new
                         # structure only if they are not already set.  We avoid copying
                         # identifiers like type_id and parent_id.  Attributes include
                         # weight, processing type, work phase, supplier, work centre,
                         # times, descriptions, notes, price, MOQ and processing cost.
-                        def copy_attr(attr):
-                            return getattr(existing_global, attr)
+                        # The values to copy are collected first and written with a
+                        # single UPDATE; ``fetch`` synchronises the new node object
+                        # so the defaults and propagation below see them.
                         attrs = [
                             'weight', 'processing_type', 'work_phase_id', 'supplier_id', 'work_center_id',
                             'standard_time', 'lead_time_theoretical', 'lead_time_real', 'description', 'notes',
                             'price_per_unit', 'minimum_order_qty', 'processing_cost'
                         ]
-                        updated = False
-                        for attr in attrs:
-                            if getattr(s, attr) in (None, '', 0) and getattr(existing_global, attr) not in (None, ''):
-                                setattr(s, attr, copy_attr(attr))
-                                updated = True
-                        if updated:
-                            try:
-                                db.session.commit()
-                            except Exception:
-                                db.session.rollback()
+                        updates = {
+                            attr: getattr(existing_global, attr) for attr in attrs
+                            if getattr(s, attr) in (None, '', 0) and getattr(existing_global, attr) not in (None, '')
+                        }
+                        if updates:
+                            (db.session.query(Structure)
+                             .filter_by(id=s.id)
+                             .update(updates, synchronize_session='fetch'))
                         # If a canonical node with the same name exists, replicate its
                         # attachments (image and document folders) to the newly created
                         # node.  This ensures that when multiple nodes share the same
                         # code, the new node inherits all files associated with the
-                        # existing node.
-                        try:
-                            # Replicate image from existing_global to new node ``s``
-                            upload_dir = os.path.join(current_app.static_folder, 'uploads')
-                            if existing_global and os.path.isdir(upload_dir):
-                                prefix_src = f"sn_{existing_global.id}_"
-                                src_file = None
-                                for _f in os.listdir(upload_dir):
-                                    if _f.startswith(prefix_src):
-                                        src_file = _f
-                                        break
-                                if src_file:
-                                    suffix = src_file[len(prefix_src):]
-                                    src_path = os.path.join(upload_dir, src_file)
-                                    dest_name = f"sn_{s.id}_{suffix}"
-                                    dest_path = os.path.join(upload_dir, dest_name)
-                                    try:
-                                        shutil.copyfile(src_path, dest_path)
-                                    except Exception:
-                                        pass
-                            # Replicate documents directory from existing_global to s
-                            if existing_global:
-                                def _safe_name(n: str) -> str:
-                                    return secure_filename(n) or 'unnamed'
-                                # Build source path parts
-                                type_dir_src = _safe_name(existing_global.type.name)
-                                parts_src: list[str] = []
-                                def _collect_src(node_obj):
-                                    if node_obj.parent:
-                                        _collect_src(node_obj.parent)
-                                    parts_src.append(_safe_name(node_obj.name))
-                                _collect_src(existing_global)
-                                base_src = os.path.join(current_app.static_folder, 'tmp_structures', type_dir_src, *parts_src)
-                                if os.path.isdir(base_src):
-                                    # Build destination path parts for new node
-                                    type_dir_dst = _safe_name(s.type.name)
-                                    parts_dst: list[str] = []
-                                    def _collect_dst(node_obj):
-                                        if node_obj.parent:
-                                            _collect_dst(node_obj.parent)
-                                        parts_dst.append(_safe_name(node_obj.name))
-                                    _collect_dst(s)
-                                    base_dst = os.path.join(current_app.static_folder, 'tmp_structures', type_dir_dst, *parts_dst)
-                                    try:
-                                        if os.path.isdir(base_dst):
-                                            shutil.rmtree(base_dst)
-                                        shutil.copytree(base_src, base_dst)
-                                    except Exception:
-                                        pass
-                        except Exception:
-                            # Silently ignore replication errors
-                            pass
+                        # existing node.  The paths are resolved after the commit
+                        # (see ``after_commit``); the documents are copied in the
+                        # background.
+                        def _replicate_attachments(s=s, existing_global=existing_global):
+                            try:
+                                # Replicate image from existing_global to new node ``s``
+                                upload_dir = os.path.join(current_app.static_folder, 'uploads')
+                                if existing_global and os.path.isdir(upload_dir):
+                                    prefix_src = f"sn_{existing_global.id}_"
+                                    src_file = next(iter(_uploads_by_struct(upload_dir).get(existing_global.id, ())), None)
+                                    if src_file:
+                                        suffix = src_file[len(prefix_src):]
+                                        src_path = os.path.join(upload_dir, src_file)
+                                        dest_name = f"sn_{s.id}_{suffix}"
+                                        dest_path = os.path.join(upload_dir, dest_name)
+                                        file_job['image_pair'] = (src_path, dest_path)
+                                # Replicate documents directory from existing_global to s
+                                if existing_global:
+                                    _safe_name = _safe_path_component
+                                    # Build source path parts
+                                    type_dir_src = _safe_name(existing_global.type.name)
+                                    # Root-to-node names from a single recursive query
+                                    parts_src = [_safe_name(name) for name in _ancestor_names(existing_global)]
+                                    base_src = os.path.join(current_app.static_folder, 'tmp_structures', type_dir_src, *parts_src)
+                                    if os.path.isdir(base_src):
+                                        # Build destination path parts for new node
+                                        type_dir_dst = _safe_name(s.type.name)
+                                        parts_dst = [_safe_name(name) for name in _ancestor_names(s)]
+                                        base_dst = os.path.join(current_app.static_folder, 'tmp_structures', type_dir_dst, *parts_dst)
+                                        file_job['docs_pair'] = (base_src, base_dst)
+                            except Exception:
+                                # Silently ignore replication errors
+                                pass
+                        after_commit.append(_replicate_attachments)
                 # ------------------------------------------------------------------
                 # Populate newly created or finalised nodes with the default values
                 # defined on the associated structure type.  When a new node is
@@ -783,11 +1587,8 @@ def structures():
                 # the "Definisci" form.  Copy those values to the node only if
                 # they have not already been specified on the node itself.  This
                 # ensures that values set during node definition (e.g. via the
-                # dedicated defaults page) are not overwritten.
-                try:
-                    stype_obj = StructureType.query.get(s.type_id)
-                except Exception:
-                    stype_obj = None
+                # dedicated defaults page) are not overwritten.  ``stype_obj`` was
+                # loaded above; the node's type_id is the submitted type.
                 if stype_obj:
                     # Weight
                     if s.weight is None and stype_obj.default_weight is not None:
@@ -824,43 +1625,52 @@ def structures():
                         s.minimum_order_qty = stype_obj.default_minimum_order_qty
                     # Derive processing cost.  Prefer the type default cost when
                     # provided; otherwise compute cost for internal processing
-                    # based on standard time and work centre hourly cost.  Reset
-                    # processing_cost unconditionally so that we always recalc
-                    # from the copied defaults when relevant.
-                    s.processing_cost = None
+                    # based on standard time and work centre hourly cost.  The
+                    # node is only touched when a value was derived, so a node
+                    # without applicable defaults is not dirtied (and rewritten)
+                    # for nothing.
+                    computed_cost = None
                     try:
                         # If type has an explicit default processing cost, use it
                         if stype_obj.default_processing_cost is not None:
-                            s.processing_cost = stype_obj.default_processing_cost
-                        else:
-                            if s.processing_type == 'internal' and s.standard_time is not None and s.work_center_id:
-                                wc_ref = WorkCenter.query.get(s.work_center_id)
-                                if wc_ref and wc_ref.hourly_cost is not None:
-                                    s.processing_cost = (s.standard_time / 60.0) * float(wc_ref.hourly_cost)
-                            elif s.processing_type == 'external' and stype_obj.default_processing_cost is not None:
-                                s.processing_cost = stype_obj.default_processing_cost
-                    except Exception:
-                        # If anything goes wrong computing cost leave it as None
-                        s.processing_cost = s.processing_cost
-                    # Persist updates to the database
-                    try:
-                        db.session.commit()
+                            computed_cost = stype_obj.default_processing_cost
+                        elif s.processing_type == 'internal' and s.standard_time is not None and s.work_center_id:
+                            wc_ref = WorkCenter.query.get(s.work_center_id)
+                            if wc_ref and wc_ref.hourly_cost is not None:
+                                computed_cost = (s.standard_time / 60.0) * float(wc_ref.hourly_cost)
                     except Exception:
-                        db.session.rollback()
+                        # If anything goes wrong computing cost leave it unchanged
+                        computed_cost = None
+                    if computed_cost is not None:
+                        s.processing_cost = computed_cost
                 # ------------------------------------------------------------------
                 # Ensure a ComponentMaster exists for this node and assign it.  This
                 # helper will create a master if missing, copy the node's
-                # attributes and attachments, and update s.component_id.  It
-                # returns the master object for further use.
+                # attributes and update s.component_id.  It returns the master
+                # object for further use; its attachments are copied after the
+                # commit.  Everything is written by the single commit below: a
+                # database error in one of these flushes leaves the session
+                # unusable, so that commit fails and the node is not created
+                # (reported to the user), rather than being half written.
                 try:
-                    master_obj = ensure_component_master_for_structure(s)
+                    master_obj = ensure_component_master_for_structure(s, commit=False)
                 except Exception:
                     master_obj = None
+                if master_obj is not None:
+                    def _plan_master_copy(s=s, m=master_obj):
+                        try:
+                            file_job['master_plan'] = _master_copy_plan(s, m)
+                        except Exception:
+                            pass
+                    after_commit.append(_plan_master_copy)
                 # ------------------------------------------------------------------
-                # After finalizing or creating, propagate to existing products
+                # After finalizing or creating, propagate to existing products.
                 try:
                     new_node_id = s.id
-                    parent_components: list[ProductComponent] = []
+                    # Only the product ids of the matching components are
+                    # needed, so select that single column (deduplicated)
+                    # instead of loading full ProductComponent objects.
+                    product_ids: list[int] = []
                     if parent_id:
                         # When the new node has a parent, propagate the node to all products
                         # that already include the parent structure.  Each ProductComponent
@@ -868,7 +1678,11 @@ def structures():
                         # iterating through these we generate a new ProductComponent for
                         # the child node for each product that contains the parent.
                         parent_id_int = int(parent_id)
-                        parent_components = ProductComponent.query.filter_by(structure_id=parent_id_int).all()
+                        product_ids = [
+                            pid for (pid,) in db.session.query(ProductComponent.product_id)
+                            .filter(ProductComponent.structure_id == parent_id_int)
+                            .distinct()
+                        ]
                     else:
                         # When the node has no parent (i.e. it is a root node of the type)
                         # we look up all ProductComponent rows referencing the same
@@ -880,30 +1694,33 @@ def structures():
                             type_int = int(type_id)
                         except Exception:
                             type_int = s.type_id
-                        parent_components = (
-                            ProductComponent.query
+                        product_ids = [
+                            pid for (pid,) in db.session.query(ProductComponent.product_id)
                             .join(Structure)
                             .filter(Structure.type_id == type_int)
-                            .all()
-                        )
+                            .distinct()
+                        ]
                     # If no parent components are found and the node is a root (no parent_id),
                     # automatically bind the node to the product corresponding to the
                     # structure type.  This ensures that newly created types without any
                     # existing components still have their root nodes visible in the
                     # inventory.  We locate (or create) a product whose name matches
                     # the type's name and attach the new node to it.
-                    if not parent_components and not parent_id:
-                        # Fetch the structure type via type_id; fall back to the node's type
-                        type_obj = StructureType.query.get(type_int)
-                        prod = None
+                    if not product_ids and not parent_id:
+                        # Reuse the structure type loaded for the defaults
+                        type_obj = stype_obj
                         if type_obj:
-                            # Look up a product with the same name as the type
+                            # Look up a product with the same name as the type;
+                            # only its id is needed.
                             try:
-                                prod = Product.query.filter_by(name=type_obj.name).first()
+                                prod_id = (db.session.query(Product.id)
+                                           .filter_by(name=type_obj.name)
+                                           .limit(1)
+                                           .scalar())
                             except Exception:
-                                prod = None
+                                prod_id = None
                             # If no such product exists, create it with a default revision
-                            if not prod:
+                            if prod_id is None:
                                 prod = Product(
                                     name=type_obj.name,
                                     description=type_obj.description or '',
@@ -912,67 +1729,87 @@ def structures():
                                 )
                                 db.session.add(prod)
                                 db.session.flush()
-                            # Create a dummy ProductComponent to drive the loop below
-                            fake_pc = ProductComponent(product_id=prod.id, structure_id=0)
-                            parent_components = [fake_pc]
-                    # For each parent component (real or synthetic), create a new
-                    # ProductComponent linking the product to this new structure.  This
-                    # logic mirrors the existing behaviour for child nodes and also
-                    # handles the synthetic entry created above when there are no
-                    # existing components for the type.
-                    for pc in parent_components:
-                        # When a synthetic ProductComponent is used (structure_id == 0),
-                        # its structure_id does not correspond to a real structure.  The
-                        # goal is only to propagate the new node to the associated product.
-                        target_product_id = pc.product_id
-                        # Skip synthetic structure_id checks; the subsequent lookup uses
-                        # only product_id and new_node_id.
-                        existing_pc = ProductComponent.query.filter_by(
-                            product_id=target_product_id,
-                            structure_id=new_node_id
-                        ).first()
-                        if not existing_pc:
-                            new_pc = ProductComponent(
-                                product_id=target_product_id,
-                                structure_id=new_node_id,
-                                quantity=1
-                            )
-                            # Always reference the master component if available
-                            if s.component_id:
-                                new_pc.component_id = s.component_id
-                            # Copy default attributes from the structure node to the new component
-                            # These become per-product overrides and will generally be ignored
-                            # in favour of the master values.
-                            if s.weight is not None:
-                                new_pc.weight = s.weight
-                            if s.processing_type:
-                                new_pc.processing_type = s.processing_type
-                            if s.work_phase_id:
-                                new_pc.work_phase_id = s.work_phase_id
-                            if s.supplier_id:
-                                new_pc.supplier_id = s.supplier_id
-                            if s.work_center_id:
-                                new_pc.work_center_id = s.work_center_id
-                            if s.standard_time is not None:
-                                new_pc.standard_time = s.standard_time
-                            if s.lead_time_theoretical is not None:
-                                new_pc.lead_time_theoretical = s.lead_time_theoretical
-                            if s.lead_time_real is not None:
-                                new_pc.lead_time_real = s.lead_time_real
-                            if s.processing_cost is not None:
-                                new_pc.processing_cost = s.processing_cost
-                            if s.description:
-                                new_pc.description = s.description
-                            if s.notes:
-                                new_pc.notes = s.notes
-                            if s.price_per_unit is not None:
-                                new_pc.price_per_unit = s.price_per_unit
-                            if s.minimum_order_qty is not None:
-                                new_pc.minimum_order_qty = s.minimum_order_qty
-                            db.session.add(new_pc)
+                                prod_id = prod.id
+                            # Propagate the node to this product in the loop below
+                            product_ids = [prod_id]
+                    # For each product found above, create a new ProductComponent
+                    # linking the product to this new structure.  This logic mirrors
+                    # the existing behaviour for child nodes and also handles the
+                    # product bound above when there are no existing components for
+                    # the type.  The products already linked to the node are read
+                    # with one query up front instead of one lookup per product.
+                    existing_product_ids = {
+                        pid for (pid,) in db.session.query(ProductComponent.product_id)
+                        .filter(ProductComponent.structure_id == new_node_id)
+                    }
+                    # Column values shared by every new component: always
+                    # reference the master component if available and copy
+                    # default attributes from the structure node.  These become
+                    # per-product overrides and will generally be ignored in
+                    # favour of the master values.
+                    base_row = {'structure_id': new_node_id, 'quantity': 1}
+                    if s.component_id:
+                        base_row['component_id'] = s.component_id
+                    if s.weight is not None:
+                        base_row['weight'] = s.weight
+                    if s.processing_type:
+                        base_row['processing_type'] = s.processing_type
+                    if s.work_phase_id:
+                        base_row['work_phase_id'] = s.work_phase_id
+                    if s.supplier_id:
+                        base_row['supplier_id'] = s.supplier_id
+                    if s.work_center_id:
+                        base_row['work_center_id'] = s.work_center_id
+                    if s.standard_time is not None:
+                        base_row['standard_time'] = s.standard_time
+                    if s.lead_time_theoretical is not None:
+                        base_row['lead_time_theoretical'] = s.lead_time_theoretical
+                    if s.lead_time_real is not None:
+                        base_row['lead_time_real'] = s.lead_time_real
+                    if s.processing_cost is not None:
+                        base_row['processing_cost'] = s.processing_cost
+                    if s.description:
+                        base_row['description'] = s.description
+                    if s.notes:
+                        base_row['notes'] = s.notes
+                    if s.price_per_unit is not None:
+                        base_row['price_per_unit'] = s.price_per_unit
+                    if s.minimum_order_qty is not None:
+                        base_row['minimum_order_qty'] = s.minimum_order_qty
+                    rows = []
+                    for target_product_id in product_ids:
+                        if target_product_id not in existing_product_ids:
+                            existing_product_ids.add(target_product_id)
+                            rows.append(dict(base_row, product_id=target_product_id))
+                    # Insert all rows with a single executemany, bypassing the
+                    # per-object unit-of-work bookkeeping.
+                    if rows:
+                        db.session.bulk_insert_mappings(ProductComponent, rows)
+                except Exception:
+                    # Propagation is best effort; see the note above
+                    pass
+                try:
                     db.session.commit()
                 except Exception:
                     db.session.rollback()
+                    flash('Errore durante la creazione del nodo.', 'danger')
+                    return redirect(url_for('admin.structures'))
+                for task in after_commit:
+                    task()
+                image_pair = file_job.pop('image_pair', None)
+                if image_pair:
+                    # A single small file: copy it before redirecting so the
+                    # next page already shows it (and before the master copy
+                    # below, which mirrors it).  An image uploaded for the
+                    # node in the meantime is never overwritten.
+                    _copy_if_missing(image_pair)
+                    _invalidate_uploads_index()
+                if file_job:
+                    # Only paths and ids are handed to the worker; the master
+                    # copy runs after the replication so it sees the new files.
+                    # Pages listing the node's documents show whatever has
+                    # been copied so far and pick up the rest on reload.
+                    _replication_pool.submit(_replicate_node_files, **file_job)
                 flash('Nodo creato.', 'success')
                 # Clear the pending node form after a successful creation
                 session.pop('pending_node_form', None)
@@ -999,7 +1836,7 @@ def structures():
                 return redirect(url_for('admin.define_structure_node_defaults', node_id=s.id))
 
     types = StructureType.query.order_by(StructureType.name.asc()).all()
-    nodes_by_type = {t.id: t.nodes.order_by(Structure.name.asc()).all() for t in types}
+    nodes_by_type = _nodes_by_type(types)
     # Fetch dictionary lists used for the definisci fields in the form
     suppliers = Supplier.query.order_by(Supplier.name.asc()).all()
     work_centers = WorkCenter.query.order_by(WorkCenter.name.asc()).all()
@@ -1047,15 +1884,10 @@ def define_structure_type_defaults(type_id: int):
         category = 'part'
     else:
         category = 'commercial'
+    # Resolve the static folder once; ``current_app`` is a context proxy and
+    # the paths below are all built from it.
+    static_folder = current_app.static_folder
 
-    # Helper function to validate allowed image file extensions.  This mirrors
-    # the logic used for product component images.  Administrators may
-    # upload a representative image when defining defaults.  Accepted
-    # extensions include common raster formats.
-    def _allowed_image(filename: str) -> bool:
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in {
-            'png', 'jpg', 'jpeg', 'gif', 'bmp'
-        }
     if request.method == 'POST':
         """Handle file uploads and default attribute updates for structure types.
 
@@ -1067,51 +1899,30 @@ def define_structure_type_defaults(type_id: int):
         """
         docs_uploaded = False
         # Map document field names to folder names by category
-        doc_fields: dict[str, str] = {}
-        if category == 'part':
-            doc_fields = {
-                'part_qualita': 'qualita',
-                'part_3_1_materiale': '3_1_materiale',
-                'part_step_tavole': 'step_tavole',
-                'part_altro': 'altro',
-            }
-        elif category == 'assembly':
-            doc_fields = {
-                'ass_qualita': 'qualita',
-                'ass_step_tavole': 'step_tavole',
-                'ass_funzionamento': 'funzionamento',
-                'ass_istruzioni': 'istruzioni',
-                'ass_altro': 'altro',
-            }
-        else:
-            doc_fields = {
-                'comm_qualita': 'qualita',
-                'comm_ddt_fornitore': 'ddt_fornitore',
-                'comm_step_tavole': 'step_tavole',
-                'comm_3_1_materiale': '3_1_materiale',
-                'comm_altro': 'altro',
-            }
+        doc_fields = _DOC_FIELDS_BY_CATEGORY[category]
         # Persist uploaded documents into ``static/tmp_structures/<type>/<folder>``
         if doc_fields:
-            def _safe(n: str) -> str:
-                return secure_filename(n) or 'unnamed'
+            _safe = _safe_path_component
             prod_dir = _safe(st.name)
-            base_path = os.path.join(current_app.static_folder, 'tmp_structures', prod_dir)
+            base_path = os.path.join(static_folder, 'tmp_structures', prod_dir)
             for field_name, folder_name in doc_fields.items():
-                files = request.files.getlist(field_name) or []
+                files = [f for f in request.files.getlist(field_name) or [] if f and f.filename]
+                if not files:
+                    continue
+                # All files of a field go to the same folder: create it once
+                # rather than once per uploaded file.
+                target_dir = os.path.join(base_path, folder_name)
+                try:
+                    os.makedirs(target_dir, exist_ok=True)
+                except Exception:
+                    pass
                 for f in files:
-                    if f and f.filename:
-                        filename = secure_filename(f.filename)
-                        target_dir = os.path.join(base_path, folder_name)
-                        try:
-                            os.makedirs(target_dir, exist_ok=True)
-                        except Exception:
-                            pass
-                        try:
-                            f.save(os.path.join(target_dir, filename))
-                            docs_uploaded = True
-                        except Exception:
-                            pass
+                    filename = secure_filename(f.filename)
+                    try:
+                        f.save(os.path.join(target_dir, filename), buffer_size=_COPY_BUFSIZE)
+                        docs_uploaded = True
+                    except Exception:
+                        pass
 
         # Handle image upload if present.  Images are named with a ``st_<id>_`` prefix
         # and stored under ``static/uploads``.
@@ -1119,25 +1930,24 @@ def define_structure_type_defaults(type_id: int):
         if image_file and _allowed_image(image_file.filename):
             filename = secure_filename(image_file.filename)
             filename = f"st_{st.id}_{filename}"
-            upload_dir = os.path.join(current_app.static_folder, 'uploads')
+            upload_dir = os.path.join(static_folder, 'uploads')
             try:
                 os.makedirs(upload_dir, exist_ok=True)
             except Exception:
                 pass
             try:
-                image_file.save(os.path.join(upload_dir, filename))
+                image_file.save(os.path.join(upload_dir, filename), buffer_size=_COPY_BUFSIZE)
+                # Remember the file name so the page does not have to search
+                # the uploads folder for it.  Committed here because a
+                # documents-only POST returns before the attributes commit.
+                st.default_image_filename = filename
+                db.session.commit()
             except Exception:
                 # Image upload is optional; ignore failures
-                pass
+                db.session.rollback()
 
         # Determine if this POST includes attribute fields beyond documents.
-        attribute_keys = [
-            'description', 'weight', 'work_phase_id', 'processing_type', 'supplier_id',
-            'work_center_id', 'standard_time', 'lead_time_theoretical', 'lead_time_real',
-            'processing_cost', 'price_per_unit', 'minimum_order_qty',
-            'stock_threshold', 'replenishment_qty'
-        ]
-        has_attribute_fields = any(k in request.form for k in attribute_keys)
+        has_attribute_fields = not _TYPE_ATTRIBUTE_KEYS.isdisjoint(request.form.keys())
 
         # When no attribute fields are present (assembly-only documents) return immediately.
         if not has_attribute_fields:
@@ -1145,86 +1955,53 @@ def define_structure_type_defaults(type_id: int):
                 flash('Documenti caricati.', 'success')
             return redirect(url_for('admin.structures'))
 
+        # Read the submitted fields from a plain dict snapshot of the form
+        # instead of looking each one up in the MultiDict.
+        form = request.form.to_dict()
         # Update default attributes.  Capture description, raw notes and weight.
-        st.default_description = request.form.get('description') or None
-        raw_notes_text = request.form.get('notes') or None
-        weight_val = request.form.get('weight') or None
-        try:
-            st.default_weight = float(weight_val) if weight_val else None
-        except (ValueError, TypeError):
-            st.default_weight = None
+        st.default_description = form.get('description') or None
+        raw_notes_text = form.get('notes') or None
+        st.default_weight = _opt_float(form.get('weight'))
         # Inventory defaults: update stock threshold and replenishment quantity
-        stock_val = request.form.get('stock_threshold') or None
-        repl_val = request.form.get('replenishment_qty') or None
-        try:
-            st.default_stock_threshold = float(stock_val) if stock_val not in (None, '') else None
-        except (ValueError, TypeError):
-            st.default_stock_threshold = None
-        try:
-            st.default_replenishment_qty = float(repl_val) if repl_val not in (None, '') else None
-        except (ValueError, TypeError):
-            st.default_replenishment_qty = None
+        st.default_stock_threshold = _opt_float(form.get('stock_threshold'))
+        st.default_replenishment_qty = _opt_float(form.get('replenishment_qty'))
         if category == 'part':
             # Populate defaults for parts
-            phase_id = request.form.get('work_phase_id') or None
+            phase_id = form.get('work_phase_id') or None
             st.default_work_phase_id = int(phase_id) if phase_id else None
-            proc_type = request.form.get('processing_type') or None
+            proc_type = form.get('processing_type') or None
             st.default_processing_type = proc_type
-            supp_id = request.form.get('supplier_id') or None
+            supp_id = form.get('supplier_id') or None
             st.default_supplier_id = int(supp_id) if supp_id else None
-            center_id = request.form.get('work_center_id') or None
+            center_id = form.get('work_center_id') or None
             st.default_work_center_id = int(center_id) if center_id else None
-            std_input = request.form.get('standard_time') or None
-            std_minutes = None
-            try:
-                std_hours = float(std_input) if std_input else None
-                std_minutes = std_hours * 60.0 if std_hours is not None else None
-            except (ValueError, TypeError):
-                std_minutes = None
+            # Standard time is entered in hours and lead times in days; both
+            # are stored in minutes.
+            std_minutes = _opt_float(form.get('standard_time'), 60.0)
             st.default_standard_time = std_minutes
-            def to_minutes(s_val):
-                try:
-                    return float(s_val) * 1440.0
-                except Exception:
-                    return None
-            st.default_lead_time_theoretical = to_minutes(request.form.get('lead_time_theoretical'))
-            st.default_lead_time_real = to_minutes(request.form.get('lead_time_real'))
-            proc_cost = request.form.get('processing_cost') or None
-            st.default_processing_cost = None
-            if proc_cost:
-                try:
-                    st.default_processing_cost = float(proc_cost)
-                except (ValueError, TypeError):
-                    st.default_processing_cost = None
+            st.default_lead_time_theoretical = _opt_float(form.get('lead_time_theoretical'), 1440.0)
+            st.default_lead_time_real = _opt_float(form.get('lead_time_real'), 1440.0)
+            st.default_processing_cost = _opt_float(form.get('processing_cost'))
             # If no explicit cost provided, compute based on processing type and work centre
             if st.default_processing_cost is None:
                 if st.default_processing_type == 'internal' and std_minutes is not None and st.default_work_center_id:
-                    wc_obj = WorkCenter.query.get(st.default_work_center_id)
+                    wc_obj = _work_center(st.default_work_center_id)
                     if wc_obj and wc_obj.hourly_cost is not None:
                         st.default_processing_cost = (std_minutes / 60.0) * wc_obj.hourly_cost
         elif category == 'commercial':
-            supp_id = request.form.get('supplier_id') or None
+            supp_id = form.get('supplier_id') or None
             st.default_supplier_id = int(supp_id) if supp_id else None
-            price_val = request.form.get('price_per_unit') or None
-            try:
-                st.default_price_per_unit = float(price_val) if price_val else None
-            except (ValueError, TypeError):
-                st.default_price_per_unit = None
-            min_qty = request.form.get('minimum_order_qty') or None
+            st.default_price_per_unit = _opt_float(form.get('price_per_unit'))
+            min_qty = form.get('minimum_order_qty') or None
             try:
                 st.default_minimum_order_qty = int(min_qty) if min_qty else None
             except (ValueError, TypeError):
                 st.default_minimum_order_qty = None
-            def to_minutes(s_val):
-                try:
-                    return float(s_val) * 1440.0
-                except Exception:
-                    return None
-            st.default_lead_time_theoretical = to_minutes(request.form.get('lead_time_theoretical'))
-            st.default_lead_time_real = to_minutes(request.form.get('lead_time_real'))
+            # Lead times are entered in days and stored in minutes
+            st.default_lead_time_theoretical = _opt_float(form.get('lead_time_theoretical'), 1440.0)
+            st.default_lead_time_real = _opt_float(form.get('lead_time_real'), 1440.0)
         # Handle additional cycles and compute aggregated processing cost if applicable
-        import json
-        cycles_json_str = request.form.get('cycles_json') or None
+        cycles_json_str = form.get('cycles_json') or None
         additional_cycles: list = []
         if cycles_json_str:
             try:
@@ -1234,68 +2011,24 @@ def define_structure_type_defaults(type_id: int):
                 # spurious empty cycles when users add and then remove rows.
                 if isinstance(parsed_cycles, list):
                     for cyc in parsed_cycles:
-                        if not isinstance(cyc, dict):
-                            continue
-                        if any(cyc.get(key) for key in [
-                            'work_phase_id', 'processing_type', 'supplier_id',
-                            'work_center_id', 'standard_time', 'lead_time_theoretical',
-                            'lead_time_real', 'processing_cost'
-                        ]):
-                            cleaned = {
-                                'work_phase_id': cyc.get('work_phase_id') or None,
-                                'processing_type': cyc.get('processing_type') or None,
-                                'supplier_id': cyc.get('supplier_id') or None,
-                                'work_center_id': cyc.get('work_center_id') or None,
-                                'standard_time': cyc.get('standard_time') or None,
-                                'lead_time_theoretical': cyc.get('lead_time_theoretical') or None,
-                                'lead_time_real': cyc.get('lead_time_real') or None,
-                                'processing_cost': cyc.get('processing_cost') or None,
-                            }
-                            additional_cycles.append(cleaned)
+                        if isinstance(cyc, dict) and any(cyc.get(key) for key in _CYCLE_KEYS):
+                            additional_cycles.append({key: cyc.get(key) or None for key in _CYCLE_KEYS})
             except Exception:
                 additional_cycles = []
         aggregated_cost = None
-        proc_cost_input = request.form.get('processing_cost') or None
+        proc_cost_input = form.get('processing_cost') or None
         if proc_cost_input:
             try:
                 aggregated_cost = float(proc_cost_input)
             except (ValueError, TypeError):
                 aggregated_cost = None
         if aggregated_cost is None and category == 'part':
-            total_cost = 0.0
-            # Primary cycle cost for internal processes; convert minutes to hours
-            if st.default_processing_type == 'internal' and st.default_standard_time is not None and st.default_work_center_id:
-                wc_obj = WorkCenter.query.get(st.default_work_center_id)
-                if wc_obj and wc_obj.hourly_cost is not None:
-                    try:
-                        total_cost += (st.default_standard_time / 60.0) * float(wc_obj.hourly_cost)
-                    except Exception:
-                        pass
-            # Additional cycle costs
-            for cycle in additional_cycles:
-                try:
-                    ctype = cycle.get('processing_type')
-                    if ctype == 'internal':
-                        st_hours = cycle.get('standard_time')
-                        wc_id = cycle.get('work_center_id')
-                        if st_hours and wc_id:
-                            try:
-                                std_h = float(st_hours)
-                                wc_obj = WorkCenter.query.get(int(wc_id))
-                                if wc_obj and wc_obj.hourly_cost is not None:
-                                    total_cost += std_h * float(wc_obj.hourly_cost)
-                            except Exception:
-                                pass
-                    elif ctype == 'external':
-                        cost_str = cycle.get('processing_cost')
-                        if cost_str:
-                            try:
-                                total_cost += float(cost_str)
-                            except (ValueError, TypeError):
-                                pass
-                except Exception:
-                    pass
-            aggregated_cost = total_cost if total_cost > 0 else None
+            aggregated_cost = _aggregated_cost(
+                st.default_processing_type,
+                st.default_standard_time / 60.0 if st.default_standard_time is not None else None,
+                st.default_work_center_id,
+                additional_cycles,
+            )
         if aggregated_cost is not None:
             st.default_processing_cost = aggregated_cost
         # Compose default_notes as JSON when cycles exist; otherwise store raw notes
@@ -1311,9 +2044,7 @@ def define_structure_type_defaults(type_id: int):
         return redirect(url_for('admin.structures'))
     # On GET, display a default‑definition page matching the product component editing view.
     # Construct a lightweight 'product' and 'component' object to reuse the products/component_detail template.
-    suppliers = Supplier.query.order_by(Supplier.name.asc()).all()
-    work_centers = WorkCenter.query.order_by(WorkCenter.name.asc()).all()
-    work_phases = WorkPhase.query.order_by(WorkPhase.name.asc()).all()
+    suppliers, work_centers, work_phases = _catalog()
 
     # Create a dummy product for display purposes.  The id is set to 0 to indicate
     # this is not a real product.  The name is derived from the structure type name.
@@ -1322,24 +2053,24 @@ def define_structure_type_defaults(type_id: int):
     structure_proxy = SimpleNamespace(name=st.name, type=st)
     # Build a dummy component with attributes mirroring those on ProductComponent.
     # Use the default values from the StructureType for parts and commercial types.
-    dummy_component = SimpleNamespace()
-    dummy_component.structure = structure_proxy
-    dummy_component.quantity = 1
-    dummy_component.description = st.default_description or ''
-    dummy_component.notes = st.default_notes or ''
-    dummy_component.weight = st.default_weight
-    # Processing parameters for parts
-    dummy_component.work_phase_id = st.default_work_phase_id
-    dummy_component.processing_type = st.default_processing_type
-    dummy_component.supplier_id = st.default_supplier_id
-    dummy_component.work_center_id = st.default_work_center_id
-    dummy_component.standard_time = st.default_standard_time
-    dummy_component.lead_time_theoretical = st.default_lead_time_theoretical
-    dummy_component.lead_time_real = st.default_lead_time_real
-    dummy_component.processing_cost = st.default_processing_cost
-    # Commercial parameters
-    dummy_component.price_per_unit = st.default_price_per_unit
-    dummy_component.minimum_order_qty = st.default_minimum_order_qty
+    dummy_component = _DefaultsComponent(
+        structure=structure_proxy,
+        description=st.default_description or '',
+        notes=st.default_notes or '',
+        weight=st.default_weight,
+        # Processing parameters for parts
+        work_phase_id=st.default_work_phase_id,
+        processing_type=st.default_processing_type,
+        supplier_id=st.default_supplier_id,
+        work_center_id=st.default_work_center_id,
+        standard_time=st.default_standard_time,
+        lead_time_theoretical=st.default_lead_time_theoretical,
+        lead_time_real=st.default_lead_time_real,
+        processing_cost=st.default_processing_cost,
+        # Commercial parameters
+        price_per_unit=st.default_price_per_unit,
+        minimum_order_qty=st.default_minimum_order_qty,
+    )
 
     # Inventory parameters: assign the default stock threshold and replenishment
     # quantity from the structure type.  These values are used to prefill
@@ -1353,26 +2084,28 @@ def define_structure_type_defaults(type_id: int):
         dummy_component.replenishment_qty = st.default_replenishment_qty
     except Exception:
         dummy_component.replenishment_qty = None
-    # Image and timestamps default to None for definition pages.  When a
-    # default image has been saved for this type, locate it in the uploads
-    # folder using a prefix based on the type id and assign it to
-    # ``image_filename`` so the template will render it.
-    dummy_component.image_filename = None
-    try:
-        upload_dir = os.path.join(current_app.static_folder, 'uploads')
-        prefix = f"st_{st.id}_"
-        if os.path.isdir(upload_dir):
-            for _fname in os.listdir(upload_dir):
-                if _fname.startswith(prefix):
-                    dummy_component.image_filename = _fname
-                    break
-    except Exception:
-        dummy_component.image_filename = None
+    # Image and timestamps default to None for definition pages.  The file
+    # name of the type's default image is stored on the type when it is
+    # uploaded.  Types whose image predates that column are looked up once in
+    # the uploads folder (``st_<type id>_`` prefix) and the result is saved.
+    dummy_component.image_filename = st.default_image_filename
+    if not dummy_component.image_filename:
+        try:
+            upload_dir = os.path.join(static_folder, 'uploads')
+            prefix = f"st_{st.id}_"
+            if os.path.isdir(upload_dir):
+                dummy_component.image_filename = _first_upload(upload_dir, prefix)
+            if dummy_component.image_filename:
+                st.default_image_filename = dummy_component.image_filename
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            dummy_component.image_filename = None
     dummy_component.created_at = None
     dummy_component.updated_at = None
     # Resolve related objects used by the template (e.g. work centre) when available
     if dummy_component.work_center_id:
-        dummy_component.work_center = WorkCenter.query.get(dummy_component.work_center_id)
+        dummy_component.work_center = _work_center(dummy_component.work_center_id)
     else:
         dummy_component.work_center = None
     # Compute processing cost on the fly for internal processing if not explicitly set
@@ -1391,108 +2124,55 @@ def define_structure_type_defaults(type_id: int):
     # identifiers to lists of files (name and relative path) so the template
     # can render links to the existing documents.
     existing_documents: dict[str, list[dict]] = {}
-    if category == 'part':
-        doc_folders = ['qualita', '3_1_materiale', 'step_tavole', 'altro']
-    elif category == 'assembly':
-        doc_folders = ['qualita', 'step_tavole', 'funzionamento', 'istruzioni', 'altro']
-    else:
-        doc_folders = ['qualita', 'ddt_fornitore', 'step_tavole', '3_1_materiale', 'altro']
-    def _safe(name: str) -> str:
-        return secure_filename(name) or 'unnamed'
+    doc_folders = _DOC_FOLDERS_BY_CATEGORY[category]
+    _safe = _safe_path_component
     prod_dir = _safe(st.name)
-    base_path = os.path.join(current_app.static_folder, 'tmp_structures', prod_dir)
+    base_path = os.path.join(static_folder, 'tmp_structures', prod_dir)
     for folder in doc_folders:
         files: list[dict] = []
         folder_path = os.path.join(base_path, folder)
+        # ``scandir`` reports the entry type without a stat per file; a
+        # missing folder simply raises and leaves the list empty.
         try:
-            if os.path.isdir(folder_path):
-                for fname in os.listdir(folder_path):
-                    full_path = os.path.join(folder_path, fname)
-                    if os.path.isfile(full_path):
-                        rel_path = os.path.join('tmp_structures', prod_dir, folder, fname)
-                        files.append({'name': fname, 'path': rel_path})
+            with os.scandir(folder_path) as it:
+                for entry in it:
+                    if entry.is_file():
+                        rel_path = os.path.join('tmp_structures', prod_dir, folder, entry.name)
+                        files.append({'name': entry.name, 'path': rel_path})
         except Exception:
             pass
         existing_documents[folder] = files
-    doc_label_map: dict[str, str] = {
-        'qualita': 'Modulo Cert. qualità',
-        '3_1_materiale': '3.1 Materiale',
-        'step_tavole': 'Step/tavola',
-        'funzionamento': 'Verifica funzionamento',
-        'istruzioni': 'Montaggio istruzioni',
-        'ddt_fornitore': 'DDT fornitore',
-        'altro': 'Altro',
-    }
-    # Extract a plain text notes value for the template.  The component.notes may
-    # contain JSON when cycles are stored, so attempt to parse it and fall back
-    # to the raw string.  This mirrors the logic in the product component
-    # detail view.  If parsing fails, use the original notes string.
-    notes_value = ''
-    try:
-        import json
-        if dummy_component.notes:
-            parsed = json.loads(dummy_component.notes)
-            if isinstance(parsed, dict) and 'notes' in parsed:
-                notes_value = parsed.get('notes', '')
-            else:
-                notes_value = dummy_component.notes
-    except Exception:
+    doc_label_map = _DOC_LABEL_MAP
+    # Extract a plain text notes value and any saved cycles for the template.
+    # The component.notes may contain JSON when cycles are stored: an object
+    # with keys ``notes`` and ``cycles``.  The string is parsed once; when it
+    # is not JSON (or has no ``notes`` key) the raw string is shown.  This
+    # mirrors the logic in the product component detail view.  The cycles
+    # let the template render additional phase rows and are used below to
+    # recompute the aggregated cost if not explicitly set.
+    parsed_obj = None
+    if dummy_component.notes:
+        try:
+            parsed_obj = json.loads(dummy_component.notes)
+        except Exception:
+            parsed_obj = None
+    if isinstance(parsed_obj, dict) and 'notes' in parsed_obj:
+        notes_value = parsed_obj.get('notes', '')
+    else:
         notes_value = dummy_component.notes or ''
-
-    # Parse any saved cycles from the default notes field.  When cycles are
-    # present, default_notes is stored as a JSON object with keys
-    # ``notes`` and ``cycles``.  Extract the cycles list so that the
-    # template can render additional phase rows, and recompute the
-    # aggregated cost if not explicitly set.  Also update notes_value
-    # accordingly.
     additional_cycles: list = []
-    try:
-        import json
-        parsed_obj = json.loads(dummy_component.notes) if dummy_component.notes else None
-        if isinstance(parsed_obj, dict):
-            # When cycles are stored, update the notes value from the dict
-            additional_cycles = parsed_obj.get('cycles', []) if parsed_obj.get('cycles') else []
-            # notes_value has been extracted above; no change needed
-    except Exception:
-        additional_cycles = []
+    if isinstance(parsed_obj, dict) and parsed_obj.get('cycles'):
+        additional_cycles = parsed_obj['cycles']
     # Compute aggregated cost for the dummy component if needed.  The cost
     # may not include additional cycles by default, so recompute when
     # cycles exist and category is 'part'.
     if category == 'part' and additional_cycles:
-        total_cost = 0.0
-        # Primary cycle cost
-        if dummy_component.processing_type == 'internal' and dummy_component.standard_time is not None and dummy_component.work_center_id:
-            try:
-                wc_obj = WorkCenter.query.get(dummy_component.work_center_id)
-                if wc_obj and wc_obj.hourly_cost is not None:
-                    total_cost += (dummy_component.standard_time / 60.0) * float(wc_obj.hourly_cost)
-            except Exception:
-                pass
-        # Additional cycles cost
-        for cycle in additional_cycles:
-            try:
-                ctype = cycle.get('processing_type')
-                if ctype == 'internal':
-                    st_hours = cycle.get('standard_time')
-                    wc_id = cycle.get('work_center_id')
-                    if st_hours and wc_id:
-                        try:
-                            std_h = float(st_hours)
-                            wc_obj = WorkCenter.query.get(int(wc_id))
-                            if wc_obj and wc_obj.hourly_cost is not None:
-                                total_cost += std_h * float(wc_obj.hourly_cost)
-                        except Exception:
-                            pass
-                elif ctype == 'external':
-                    cost_str = cycle.get('processing_cost')
-                    if cost_str:
-                        try:
-                            total_cost += float(cost_str)
-                        except (ValueError, TypeError):
-                            pass
-            except Exception:
-                pass
-        dummy_component.processing_cost = total_cost if total_cost > 0 else None
+        dummy_component.processing_cost = _aggregated_cost(
+            dummy_component.processing_type,
+            dummy_component.standard_time / 60.0 if dummy_component.standard_time is not None else None,
+            dummy_component.work_center_id,
+            additional_cycles,
+        )
     # Determine flagged documents for this structure type.  Because this page
     # edits defaults at the type level, there may not be a concrete structure
     # identifier to use.  Attempt to retrieve the underlying id from the
@@ -1512,31 +2192,8 @@ def define_structure_type_defaults(type_id: int):
             struct_id = None
         if struct_id is not None and str(struct_id) in cl_map:
             raw_paths = cl_map.get(str(struct_id), []) or []
-            # Normalise and collect paths into a set for quick lookup
-            norm_set: set[str] = set()
-            for p in raw_paths:
-                if not isinstance(p, str):
-                    continue
-                try:
-                    norm = p.replace('\\', '/').strip()
-                except Exception:
-                    norm = p
-                if norm:
-                    norm_set.add(norm)
-            flagged_docs = norm_set
-            # Derive auxiliary sets of filenames and base names (case-insensitive)
-            flagged_filenames: set[str] = set()
-            flagged_basenames: set[str] = set()
-            for path in norm_set:
-                parts = path.split('/')
-                if parts:
-                    fname = parts[-1]
-                    fname_lower = str(fname).lower()
-                    flagged_filenames.add(fname_lower)
-                    base_no_ext = fname_lower.rsplit('.', 1)[0]
-                    base_original = base_no_ext.split('_compiled_')[0]
-                    if base_original:
-                        flagged_basenames.add(base_original)
+            # Normalised paths plus lower-case file and base names for matching
+            flagged_docs, flagged_filenames, flagged_basenames = _flagged_doc_sets(raw_paths)
         else:
             flagged_docs = set()
             flagged_filenames = set()
@@ -1596,6 +2253,8 @@ def define_structure_node_defaults(node_id: int):
         category = 'part'
     else:
         category = 'commercial'
+    # Resolve the static folder once for the upload and document paths below.
+    static_folder = current_app.static_folder
     if request.method == 'POST':
         """
         Handle saving of documents, images and default attributes for structure nodes.
@@ -1607,6 +2266,8 @@ def define_structure_node_defaults(node_id: int):
         node, the master is updated and changes automatically propagate to
         all structures and product components sharing the same code.
         """
+        # Bind the submitted form once; it is read many times below.
+        form = request.form
         # Ensure there is a ComponentMaster for this structure before updating
         try:
             ensure_component_master_for_structure(s)
@@ -1614,30 +2275,7 @@ def define_structure_node_defaults(node_id: int):
             pass
         master = getattr(s, 'component_master', None)
         # Decide document fields based on category
-        doc_fields: dict[str, str] = {}
-        if category == 'part':
-            doc_fields = {
-                'part_qualita': 'qualita',
-                'part_3_1_materiale': '3_1_materiale',
-                'part_step_tavole': 'step_tavole',
-                'part_altro': 'altro',
-            }
-        elif category == 'assembly':
-            doc_fields = {
-                'ass_qualita': 'qualita',
-                'ass_step_tavole': 'step_tavole',
-                'ass_funzionamento': 'funzionamento',
-                'ass_istruzioni': 'istruzioni',
-                'ass_altro': 'altro',
-            }
-        else:  # commercial
-            doc_fields = {
-                'comm_qualita': 'qualita',
-                'comm_ddt_fornitore': 'ddt_fornitore',
-                'comm_step_tavole': 'step_tavole',
-                'comm_3_1_materiale': '3_1_materiale',
-                'comm_altro': 'altro',
-            }
+        doc_fields = _DOC_FIELDS_BY_CATEGORY[category]
         # -------------------------------------------------------------------
         # Save uploaded documents.  When a master exists, documents are stored
         # under ``static/tmp_components/<code>/<folder>``.  Otherwise they fall
@@ -1645,14 +2283,13 @@ def define_structure_node_defaults(node_id: int):
         # flag tracks whether any file was saved to show a success message.
         docs_uploaded = False
         if doc_fields:
-            def _safe_name(name: str) -> str:
-                return secure_filename(name) or 'unnamed'
+            _safe_name = _safe_path_component
             # Determine base path.  Prefer the master path for a global code.
             base_path: str | None = None
             if master:
                 try:
                     base_path = os.path.join(
-                        current_app.static_folder,
+                        static_folder,
                         'tmp_components',
                         _safe_name(master.code)
                     )
@@ -1662,46 +2299,45 @@ def define_structure_node_defaults(node_id: int):
                 # Fallback to tmp_structures path (legacy) if master missing
                 type_dir = _safe_name(s.type.name)
                 struct_parts: list[str] = []
-                def _collect_path(node_obj):
-                    if node_obj.parent:
-                        _collect_path(node_obj.parent)
-                    struct_parts.append(_safe_name(node_obj.name))
-                _collect_path(s)
-                base_path = os.path.join(current_app.static_folder, 'tmp_structures', type_dir, *struct_parts)
+                # Root-to-node names from a single recursive query
+                struct_parts.extend(_safe_name(name) for name in _ancestor_names(s))
+                base_path = os.path.join(static_folder, 'tmp_structures', type_dir, *struct_parts)
             for field_name, folder_name in doc_fields.items():
-                files = request.files.getlist(field_name) or []
+                files = [f for f in request.files.getlist(field_name) or [] if f and f.filename]
+                if not files:
+                    continue
+                # All files of a field go to the same folder: create it once
+                # rather than once per uploaded file.
+                target_dir = os.path.join(base_path, folder_name)
+                try:
+                    os.makedirs(target_dir, exist_ok=True)
+                except Exception:
+                    pass
                 for f in files:
-                    if f and f.filename:
-                        filename = secure_filename(f.filename)
-                        target_dir = os.path.join(base_path, folder_name)
-                        try:
-                            os.makedirs(target_dir, exist_ok=True)
-                        except Exception:
-                            pass
-                        try:
-                            f.save(os.path.join(target_dir, filename))
-                            docs_uploaded = True
-                        except Exception:
-                            pass
+                    filename = secure_filename(f.filename)
+                    try:
+                        f.save(os.path.join(target_dir, filename), buffer_size=_COPY_BUFSIZE)
+                        docs_uploaded = True
+                    except Exception:
+                        pass
         # -------------------------------------------------------------------
         # Save uploaded image.  If a master exists the image is stored with
         # prefix ``cm_<id>_`` so it is shared globally.  Otherwise fall back
         # to the legacy ``sn_<structure id>_`` prefix.
-        def _allowed_image(filename: str) -> bool:
-            return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
         image_file = request.files.get('image')
         if image_file and _allowed_image(image_file.filename):
             filename = secure_filename(image_file.filename)
-            upload_dir = os.path.join(current_app.static_folder, 'uploads')
+            upload_dir = os.path.join(static_folder, 'uploads')
             os.makedirs(upload_dir, exist_ok=True)
             if master:
                 dest_name = f"cm_{master.id}_{filename}"
             else:
                 dest_name = f"sn_{s.id}_{filename}"
             try:
-                image_file.save(os.path.join(upload_dir, dest_name))
+                image_file.save(os.path.join(upload_dir, dest_name), buffer_size=_COPY_BUFSIZE)
             except Exception:
                 pass
+            _invalidate_uploads_index()
         # -------------------------------------------------------------------
         # Save compatible revisions selections on POST.  The "compatible_revisions"
         # field may be submitted either via the main save form or via the
@@ -1717,9 +2353,9 @@ def define_structure_node_defaults(node_id: int):
             # only a single comma‑separated string is posted (e.g. from
             # a multi‑select in some browsers), split it on commas.  The
             # current revision itself should not be stored, so filter it out.
-            compat_vals = request.form.getlist('compatible_revisions') or []
+            compat_vals = form.getlist('compatible_revisions') or []
             if not compat_vals:
-                raw_val = request.form.get('compatible_revisions')
+                raw_val = form.get('compatible_revisions')
                 if raw_val:
                     # Split comma‑separated string into individual values
                     compat_vals = [v.strip() for v in raw_val.split(',') if v.strip()]
@@ -1727,34 +2363,28 @@ def define_structure_node_defaults(node_id: int):
             # between no submissions (retain existing value) and empty
             # submission (clear value).  request.form lists keys for
             # submitted inputs.
-            if 'compatible_revisions' in request.form or 'current_revision' in request.form or compat_vals:
+            if 'compatible_revisions' in form or 'current_revision' in form or compat_vals:
                 # Build a list of selected previous revisions, preserving
                 # order, and skip the current revision (s.revision_label).
-                selected_prev: list[str] = []
-                try:
-                    for letter in s.revision_letters:
-                        if letter == s.revision_label:
-                            continue
-                        if letter in compat_vals and letter not in selected_prev:
-                            selected_prev.append(letter)
-                except Exception:
-                    # Fallback: if revision_letters is unavailable, use the raw values
-                    for val in compat_vals:
-                        if val != s.revision_label and val not in selected_prev:
-                            selected_prev.append(val)
-                s.compatible_revisions = ','.join(selected_prev) if selected_prev else None
-                # Persist the compatibility selections immediately.  Without
-                # committing here the change could be lost if subsequent logic
-                # returns early (e.g. documents-only upload) or an exception
-                # occurs before the next commit.  Refresh the in-memory
-                # structure instance so template rendering after redirect
-                # reflects the updated list.
+                # Both properties are recomputed on every access, so read
+                # them once; revision_letters never repeats a label, so no
+                # de-duplication is needed on that path.
+                compat_set = set(compat_vals)
+                current_label = s.revision_label
                 try:
-                    db.session.commit()
-                    db.session.refresh(s)
+                    letters = s.revision_letters
+                    selected_prev = [l for l in letters if l != current_label and l in compat_set]
                 except Exception:
-                    # If commit or refresh fails, rollback to a clean state.
-                    db.session.rollback()
+                    # Fallback: if revision_letters is unavailable, use the raw
+                    # values, dropping duplicates while keeping their order.
+                    selected_prev = [v for v in dict.fromkeys(compat_vals) if v != current_label]
+                # The selection is committed together with the rest of the
+                # form, both on the early return below and at the end.  Only
+                # assign when it differs so an unchanged toggle leaves the
+                # structure clean and adds nothing to the flush.
+                new_compat = ','.join(selected_prev) if selected_prev else None
+                if new_compat != s.compatible_revisions:
+                    s.compatible_revisions = new_compat
         except Exception:
             # Ignore errors; compatibility is optional
             pass
@@ -1770,20 +2400,15 @@ def define_structure_node_defaults(node_id: int):
         # fields are present (i.e. the user only toggled compatibility or
         # uploaded documents), skip the subsequent attribute update logic and
         # redirect early after flashing any document upload messages.
-        attribute_keys = [
-            'description', 'weight', 'work_phase_id', 'processing_type', 'supplier_id',
-            'work_center_id', 'standard_time', 'lead_time_theoretical', 'lead_time_real',
-            'processing_cost', 'price_per_unit', 'minimum_order_qty',
-            # Inventory management fields: include stock threshold and replenishment quantity so
-            # that a POST containing only these values will still be processed as an attribute
-            # update rather than being treated as a documents-only submission.
-            'stock_threshold', 'replenishment_qty',
-            'quantity', 'lot_management', 'is_sellable', 'guiding_part'
-        ]
-        has_other_attributes = any(k in request.form for k in attribute_keys)
+        has_other_attributes = not _NODE_ATTRIBUTE_KEYS.isdisjoint(form.keys())
         # If there are no other attribute fields besides compatibility controls,
         # return early after processing compatibility and/or document uploads.
         if not has_other_attributes:
+            # Persist the compatibility selection (if any)
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
             if docs_uploaded:
                 flash('Documenti caricati.', 'success')
             # When only compatibility or documents were updated, avoid
@@ -1801,8 +2426,8 @@ def define_structure_node_defaults(node_id: int):
         # otherwise fall back to the structure itself.  Additionally,
         # propagate these flags to all product components referencing this
         # structure to keep values consistent across products.
-        sellable_flag = True if request.form.get('is_sellable') else False
-        guiding_flag = True if request.form.get('guiding_part') else False
+        sellable_flag = True if form.get('is_sellable') else False
+        guiding_flag = True if form.get('guiding_part') else False
         try:
             if master:
                 master.is_sellable = sellable_flag
@@ -1810,85 +2435,30 @@ def define_structure_node_defaults(node_id: int):
             else:
                 s.is_sellable = sellable_flag
                 s.guiding_part = guiding_flag
-            # Propagate to all related product components.  If a specific pc_id
-            # is provided, update only that component; otherwise update
-            # components filtered by product id or all components.
-            comps_to_update: list[ProductComponent] = []
-            if pc_id_param:
-                try:
-                    pc_int = int(pc_id_param)
-                    comp = ProductComponent.query.get(pc_int)
-                    if comp:
-                        comps_to_update.append(comp)
-                except Exception:
-                    comps_to_update = comps_to_update
-            elif return_to_param:
-                try:
-                    import re
-                    m_prod = re.search(r"/products/(\d+)", return_to_param)
-                    if m_prod:
-                        pid = int(m_prod.group(1))
-                        comp = ProductComponent.query.filter_by(product_id=pid, structure_id=s.id).first()
-                        if comp:
-                            comps_to_update.append(comp)
-                except Exception:
-                    pass
-            # If no specific component context, update all components referencing this node
-            if not comps_to_update:
-                comps_to_update = ProductComponent.query.filter_by(structure_id=s.id).all()
-            for _c in comps_to_update:
-                try:
-                    _c.is_sellable = sellable_flag
-                    _c.guiding_part = guiding_flag
-                except Exception:
-                    pass
-            db.session.commit()
+            # Propagate to the related product components with one UPDATE.  If
+            # a specific pc_id is provided, update only that component;
+            # otherwise update the component of the product in return_to or
+            # all components referencing this node.
+            _update_node_components(s.id, pc_id_param, return_to_param, {
+                ProductComponent.is_sellable: sellable_flag,
+                ProductComponent.guiding_part: guiding_flag,
+            })
         except Exception:
             # Ignore any errors; flags are optional
-            db.session.rollback()
+            pass
         # -------------------------------------------------------------------
         # Handle quantity updates for this node.  When a quantity field is
         # provided, update the quantity on all product components referencing
         # this structure.  Only positive integers are considered valid.
-        qty_val = request.form.get('quantity') or None
+        qty_val = form.get('quantity') or None
         if qty_val:
             try:
                 qty_int = int(qty_val)
                 if qty_int > 0:
-                    # Determine which components to update.  If a specific pc_id was
-                    # provided, update only that component.  Else, if return_to
-                    # contains a product id, update the component belonging to that
-                    # product.  Otherwise update all components referencing this
-                    # structure.
-                    updated = False
-                    if pc_id_param:
-                        try:
-                            pcid_int = int(pc_id_param)
-                            comp = ProductComponent.query.get(pcid_int)
-                            if comp:
-                                comp.quantity = qty_int
-                                db.session.commit()
-                                updated = True
-                        except Exception:
-                            pass
-                    elif return_to_param:
-                        try:
-                            import re
-                            m_prod = re.search(r"/products/(\d+)", return_to_param)
-                            if m_prod:
-                                prod_id = int(m_prod.group(1))
-                                comp = ProductComponent.query.filter_by(product_id=prod_id, structure_id=s.id).first()
-                                if comp:
-                                    comp.quantity = qty_int
-                                    db.session.commit()
-                                    updated = True
-                        except Exception:
-                            pass
-                    if not updated:
-                        comps = ProductComponent.query.filter_by(structure_id=s.id).all()
-                        for comp in comps:
-                            comp.quantity = qty_int
-                        db.session.commit()
+                    # Update the component identified by pc_id, else the one of
+                    # the product in return_to, else all components referencing
+                    # this structure, in a single UPDATE.
+                    _update_node_components(s.id, pc_id_param, return_to_param, {ProductComponent.quantity: qty_int})
             except Exception:
                 # Ignore invalid quantity input
                 pass
@@ -1896,7 +2466,12 @@ def define_structure_node_defaults(node_id: int):
         # At this point we have attribute fields to update.  Update the master
         # record with the canonical information.  Fall back to updating the
         # structure directly only when a master is not present.
-        raw_notes_text = request.form.get('notes') or None
+        raw_notes_text = form.get('notes') or None
+        # Fields read by both the master and the structure branch below
+        desc_val = form.get('description') or None
+        weight_val = form.get('weight') or None
+        stock_val = form.get('stock_threshold') or None
+        repl_val = form.get('replenishment_qty') or None
         # Helper: convert days to minutes
         def _to_minutes(days_val: str | None) -> float | None:
             try:
@@ -1905,8 +2480,7 @@ def define_structure_node_defaults(node_id: int):
                 return None
         if master:
             # Update description and weight
-            master.description = request.form.get('description') or None
-            weight_val = request.form.get('weight') or None
+            master.description = desc_val
             try:
                 master.weight = float(weight_val) if weight_val else None
             except (ValueError, TypeError):
@@ -1926,8 +2500,6 @@ def define_structure_node_defaults(node_id: int):
             # Inventory management: update stock threshold and replenishment quantity on the master.
             # Read values from the form and convert to floats when provided.  If the
             # input is empty or invalid, store None to indicate the field is unset.
-            stock_val = request.form.get('stock_threshold') or None
-            repl_val = request.form.get('replenishment_qty') or None
             try:
                 master.stock_threshold = float(stock_val) if stock_val not in (None, '') else None
             except (ValueError, TypeError):
@@ -1938,10 +2510,10 @@ def define_structure_node_defaults(node_id: int):
                 master.replenishment_qty = None
             # Handle part-specific fields and cycles
             if category == 'part':
-                phase_id = request.form.get('work_phase_id') or None
+                phase_id = form.get('work_phase_id') or None
                 master.work_phase_id = int(phase_id) if phase_id else None
-                master.processing_type = request.form.get('processing_type') or None
-                supp_id = request.form.get('supplier_id') or None
+                master.processing_type = form.get('processing_type') or None
+                supp_id = form.get('supplier_id') or None
                 # Safely convert supplier identifier to integer if possible
                 if supp_id:
                     try:
@@ -1950,66 +2522,46 @@ def define_structure_node_defaults(node_id: int):
                         master.supplier_id = None
                 else:
                     master.supplier_id = None
-                center_id = request.form.get('work_center_id') or None
+                center_id = form.get('work_center_id') or None
                 master.work_center_id = int(center_id) if center_id else None
                 # Standard time (hours -> minutes)
-                std_input = request.form.get('standard_time') or None
+                std_input = form.get('standard_time') or None
                 try:
                     std_hours = float(std_input) if std_input else None
                 except (ValueError, TypeError):
                     std_hours = None
                 master.standard_time = std_hours * 60.0 if std_hours is not None else None
-                master.lead_time_theoretical = _to_minutes(request.form.get('lead_time_theoretical'))
-                master.lead_time_real = _to_minutes(request.form.get('lead_time_real'))
+                master.lead_time_theoretical = _to_minutes(form.get('lead_time_theoretical'))
+                master.lead_time_real = _to_minutes(form.get('lead_time_real'))
                 # Parse additional cycles (list of dicts) from cycles_json hidden field
-                import json
-                cycles_json_str = request.form.get('cycles_json') or None
+                cycles_json_str = form.get('cycles_json') or None
                 additional_cycles: list = []
                 if cycles_json_str:
                     try:
                         parsed_cycles = json.loads(cycles_json_str)
                         if isinstance(parsed_cycles, list):
                             for cyc in parsed_cycles:
-                                if not isinstance(cyc, dict):
-                                    continue
-                                if any(cyc.get(key) for key in [
-                                    'work_phase_id', 'processing_type', 'supplier_id',
-                                    'work_center_id', 'standard_time', 'lead_time_theoretical',
-                                    'lead_time_real', 'processing_cost'
-                                ]):
-                                    cleaned = {
-                                        'work_phase_id': cyc.get('work_phase_id') or None,
-                                        'processing_type': cyc.get('processing_type') or None,
-                                        'supplier_id': cyc.get('supplier_id') or None,
-                                        'work_center_id': cyc.get('work_center_id') or None,
-                                        'standard_time': cyc.get('standard_time') or None,
-                                        'lead_time_theoretical': cyc.get('lead_time_theoretical') or None,
-                                        'lead_time_real': cyc.get('lead_time_real') or None,
-                                        'processing_cost': cyc.get('processing_cost') or None,
-                                    }
-                                    additional_cycles.append(cleaned)
+                                if isinstance(cyc, dict) and any(cyc.get(key) for key in _CYCLE_KEYS):
+                                    additional_cycles.append({key: cyc.get(key) or None for key in _CYCLE_KEYS})
                     except Exception:
                         additional_cycles = []
                 # Fallback: build cycles from repeated form fields if cycles_json missing
                 if not additional_cycles:
                     try:
-                        phases_all = request.form.getlist('work_phase_id')
-                        procs_all = request.form.getlist('processing_type')
-                        suppliers_all = request.form.getlist('supplier_id')
-                        centers_all = request.form.getlist('work_center_id')
-                        stds_all = request.form.getlist('standard_time')
-                        lt_theo_all = request.form.getlist('lead_time_theoretical')
-                        lt_real_all = request.form.getlist('lead_time_real')
-                        total_cycles = len(procs_all)
-                        for idx in range(1, total_cycles):
-                            cyc_phase = phases_all[idx] if idx < len(phases_all) else ''
-                            cyc_proc = procs_all[idx] if idx < len(procs_all) else ''
-                            cyc_supplier = suppliers_all[idx] if idx < len(suppliers_all) else ''
-                            cyc_center = centers_all[idx] if idx < len(centers_all) else ''
-                            cyc_std = stds_all[idx] if idx < len(stds_all) else ''
-                            cyc_lt_theo = lt_theo_all[idx] if idx < len(lt_theo_all) else ''
-                            cyc_lt_real = lt_real_all[idx] if idx < len(lt_real_all) else ''
-                            if any([cyc_phase, cyc_proc, cyc_supplier, cyc_center, cyc_std, cyc_lt_theo, cyc_lt_real]):
+                        phases_all = form.getlist('work_phase_id')
+                        procs_all = form.getlist('processing_type')
+                        suppliers_all = form.getlist('supplier_id')
+                        centers_all = form.getlist('work_center_id')
+                        stds_all = form.getlist('standard_time')
+                        lt_theo_all = form.getlist('lead_time_theoretical')
+                        lt_real_all = form.getlist('lead_time_real')
+                        # Row 0 is the primary cycle; the number of processing
+                        # types decides how many rows there are, shorter lists
+                        # are padded with blanks.
+                        rows = zip_longest(phases_all, procs_all, suppliers_all, centers_all,
+                                           stds_all, lt_theo_all, lt_real_all, fillvalue='')
+                        for cyc_phase, cyc_proc, cyc_supplier, cyc_center, cyc_std, cyc_lt_theo, cyc_lt_real in islice(rows, 1, len(procs_all)):
+                            if any((cyc_phase, cyc_proc, cyc_supplier, cyc_center, cyc_std, cyc_lt_theo, cyc_lt_real)):
                                 additional_cycles.append({
                                     'work_phase_id': cyc_phase or None,
                                     'processing_type': cyc_proc or None,
@@ -2024,47 +2576,16 @@ def define_structure_node_defaults(node_id: int):
                         additional_cycles = additional_cycles
                 # Determine aggregated processing cost.  Prefer client-provided value
                 aggregated_cost: float | None = None
-                proc_cost_input = request.form.get('processing_cost') or None
+                proc_cost_input = form.get('processing_cost') or None
                 if proc_cost_input:
                     try:
                         aggregated_cost = float(proc_cost_input)
                     except (ValueError, TypeError):
                         aggregated_cost = None
                 if aggregated_cost is None:
-                    total_cost = 0.0
-                    # cost for primary cycle (internal only)
-                    if master.processing_type == 'internal' and std_hours is not None and master.work_center_id:
-                        wc_obj = WorkCenter.query.get(master.work_center_id)
-                        if wc_obj and wc_obj.hourly_cost is not None:
-                            try:
-                                total_cost += std_hours * float(wc_obj.hourly_cost)
-                            except Exception:
-                                pass
-                    # cost for additional cycles
-                    for cycle in additional_cycles:
-                        try:
-                            ctype = cycle.get('processing_type')
-                            if ctype == 'internal':
-                                st_val = cycle.get('standard_time')
-                                wc_id = cycle.get('work_center_id')
-                                if st_val and wc_id:
-                                    try:
-                                        st_float = float(st_val)
-                                        wc_obj = WorkCenter.query.get(int(wc_id))
-                                        if wc_obj and wc_obj.hourly_cost is not None:
-                                            total_cost += st_float * float(wc_obj.hourly_cost)
-                                    except Exception:
-                                        pass
-                            elif ctype == 'external':
-                                cost_str = cycle.get('processing_cost')
-                                if cost_str:
-                                    try:
-                                        total_cost += float(cost_str)
-                                    except (ValueError, TypeError):
-                                        pass
-                        except Exception:
-                            pass
-                    aggregated_cost = total_cost if total_cost > 0 else None
+                    aggregated_cost = _aggregated_cost(
+                        master.processing_type, std_hours, master.work_center_id, additional_cycles
+                    )
                 master.processing_cost = aggregated_cost
                 # Compose notes JSON if cycles exist; otherwise store raw notes
                 if additional_cycles:
@@ -2075,7 +2596,7 @@ def define_structure_node_defaults(node_id: int):
                 else:
                     master.notes = raw_notes_text
             elif category == 'commercial':
-                supp_id = request.form.get('supplier_id') or None
+                supp_id = form.get('supplier_id') or None
                 # Safely convert supplier identifier to integer if possible
                 if supp_id:
                     try:
@@ -2084,20 +2605,20 @@ def define_structure_node_defaults(node_id: int):
                         master.supplier_id = None
                 else:
                     master.supplier_id = None
-                price_val = request.form.get('price_per_unit') or None
+                price_val = form.get('price_per_unit') or None
                 try:
                     master.price_per_unit = float(price_val) if price_val else None
                 except (ValueError, TypeError):
                     master.price_per_unit = None
-                min_qty = request.form.get('minimum_order_qty') or None
+                min_qty = form.get('minimum_order_qty') or None
                 try:
                     master.minimum_order_qty = int(min_qty) if min_qty else None
                 except (ValueError, TypeError):
                     master.minimum_order_qty = None
-                master.lead_time_theoretical = _to_minutes(request.form.get('lead_time_theoretical'))
-                master.lead_time_real = _to_minutes(request.form.get('lead_time_real'))
+                master.lead_time_theoretical = _to_minutes(form.get('lead_time_theoretical'))
+                master.lead_time_real = _to_minutes(form.get('lead_time_real'))
                 # Compose notes JSON with optional lot_management flag
-                lot_flag = True if request.form.get('lot_management') else False
+                lot_flag = True if form.get('lot_management') else False
                 notes_input = raw_notes_text
                 notes_dict = {}
                 # Always include a notes key when lot management is enabled
@@ -2108,8 +2629,7 @@ def define_structure_node_defaults(node_id: int):
                     notes_dict['lot_management'] = True
                 if notes_dict:
                     try:
-                        import json as _json
-                        master.notes = _json.dumps(notes_dict)
+                        master.notes = json.dumps(notes_dict)
                     except Exception:
                         master.notes = notes_input
                 else:
@@ -2117,31 +2637,18 @@ def define_structure_node_defaults(node_id: int):
             else:  # assemblies
                 # Assemblies only store description and notes
                 master.notes = raw_notes_text
-            # Persist master updates
-            db.session.commit()
-            # Optionally mirror master fields onto structure for backward compatibility
+            # Optionally mirror master fields onto structure for backward
+            # compatibility, as one UPDATE inside the form's transaction.
             try:
-                s.description = master.description
-                s.weight = master.weight
-                s.processing_type = master.processing_type
-                s.work_phase_id = master.work_phase_id
-                s.supplier_id = master.supplier_id
-                s.work_center_id = master.work_center_id
-                s.standard_time = master.standard_time
-                s.lead_time_theoretical = master.lead_time_theoretical
-                s.lead_time_real = master.lead_time_real
-                s.processing_cost = master.processing_cost
-                s.price_per_unit = master.price_per_unit
-                s.minimum_order_qty = master.minimum_order_qty
-                s.notes = master.notes
-                db.session.commit()
+                (Structure.query.filter(Structure.id == s.id)
+                 .update({getattr(Structure, f): getattr(master, f) for f in _MASTER_MIRROR_FIELDS},
+                         synchronize_session='evaluate'))
             except Exception:
-                db.session.rollback()
+                pass
         else:
             # No master available; update the structure as a fallback (legacy behaviour)
             # Update description, weight and notes
-            s.description = request.form.get('description') or None
-            weight_val = request.form.get('weight') or None
+            s.description = desc_val
             try:
                 s.weight = float(weight_val) if weight_val else None
             except (ValueError, TypeError):
@@ -2149,8 +2656,6 @@ def define_structure_node_defaults(node_id: int):
             s.notes = raw_notes_text
 
             # Inventory management: update stock threshold and replenishment quantity on the structure
-            stock_val = request.form.get('stock_threshold') or None
-            repl_val = request.form.get('replenishment_qty') or None
             try:
                 s.stock_threshold = float(stock_val) if stock_val not in (None, '') else None
             except (ValueError, TypeError):
@@ -2161,41 +2666,35 @@ def define_structure_node_defaults(node_id: int):
                 s.replenishment_qty = None
             # Continue to update category-specific fields on structure
             if category == 'part':
-                phase_id = request.form.get('work_phase_id') or None
+                phase_id = form.get('work_phase_id') or None
                 s.work_phase_id = int(phase_id) if phase_id else None
-                proc_type = request.form.get('processing_type') or None
+                proc_type = form.get('processing_type') or None
                 s.processing_type = proc_type
-                supp_id = request.form.get('supplier_id') or None
+                supp_id = form.get('supplier_id') or None
                 s.supplier_id = int(supp_id) if supp_id else None
-                center_id = request.form.get('work_center_id') or None
+                center_id = form.get('work_center_id') or None
                 s.work_center_id = int(center_id) if center_id else None
-                std_input = request.form.get('standard_time') or None
+                std_input = form.get('standard_time') or None
                 try:
                     std_hours = float(std_input) if std_input else None
                 except (ValueError, TypeError):
                     std_hours = None
                 s.standard_time = std_hours * 60.0 if std_hours is not None else None
-                s.lead_time_theoretical = _to_minutes(request.form.get('lead_time_theoretical'))
-                s.lead_time_real = _to_minutes(request.form.get('lead_time_real'))
-                try:
-                    s.processing_cost = float(request.form.get('processing_cost')) if request.form.get('processing_cost') else None
-                except (ValueError, TypeError):
-                    s.processing_cost = None
+                s.lead_time_theoretical = _to_minutes(form.get('lead_time_theoretical'))
+                s.lead_time_real = _to_minutes(form.get('lead_time_real'))
+                s.processing_cost = _opt_float(form.get('processing_cost'))
             elif category == 'commercial':
-                supp_id = request.form.get('supplier_id') or None
+                supp_id = form.get('supplier_id') or None
                 s.supplier_id = int(supp_id) if supp_id else None
+                s.price_per_unit = _opt_float(form.get('price_per_unit'))
                 try:
-                    s.price_per_unit = float(request.form.get('price_per_unit')) if request.form.get('price_per_unit') else None
-                except (ValueError, TypeError):
-                    s.price_per_unit = None
-                try:
-                    s.minimum_order_qty = int(request.form.get('minimum_order_qty')) if request.form.get('minimum_order_qty') else None
+                    s.minimum_order_qty = int(form.get('minimum_order_qty')) if form.get('minimum_order_qty') else None
                 except (ValueError, TypeError):
                     s.minimum_order_qty = None
-                s.lead_time_theoretical = _to_minutes(request.form.get('lead_time_theoretical'))
-                s.lead_time_real = _to_minutes(request.form.get('lead_time_real'))
+                s.lead_time_theoretical = _to_minutes(form.get('lead_time_theoretical'))
+                s.lead_time_real = _to_minutes(form.get('lead_time_real'))
                 # Compose notes JSON with optional lot_management flag
-                lot_flag = True if request.form.get('lot_management') else False
+                lot_flag = True if form.get('lot_management') else False
                 notes_input = raw_notes_text
                 notes_dict = {}
                 # Always include a notes key when lot management is enabled
@@ -2206,15 +2705,12 @@ def define_structure_node_defaults(node_id: int):
                     notes_dict['lot_management'] = True
                 if notes_dict:
                     try:
-                        import json as _json
-                        s.notes = _json.dumps(notes_dict)
+                        s.notes = json.dumps(notes_dict)
                     except Exception:
                         s.notes = notes_input
                 else:
                     s.notes = None
-            db.session.commit()
         # End of attribute handling
-        flash('Attributi del nodo salvati.', 'success')
 
         # -----------------------------------------------------------------
         # Propagate inventory fields (stock threshold and replenishment quantity)
@@ -2236,38 +2732,12 @@ def define_structure_node_defaults(node_id: int):
             else:
                 stock_to_propagate = s.stock_threshold
                 repl_to_propagate = s.replenishment_qty
-            comps_to_update: list[ProductComponent] = []
-            if pc_id_param:
-                try:
-                    pc_int = int(pc_id_param)
-                    comp = ProductComponent.query.get(pc_int)
-                    if comp:
-                        comps_to_update.append(comp)
-                except Exception:
-                    comps_to_update = comps_to_update
-            elif return_to_param:
-                try:
-                    import re as _re
-                    m_prod = _re.search(r"/products/(\d+)", return_to_param)
-                    if m_prod:
-                        pid = int(m_prod.group(1))
-                        comp = ProductComponent.query.filter_by(product_id=pid, structure_id=s.id).first()
-                        if comp:
-                            comps_to_update.append(comp)
-                except Exception:
-                    pass
-            # If no specific component context, update all components referencing this node
-            if not comps_to_update:
-                comps_to_update = ProductComponent.query.filter_by(structure_id=s.id).all()
-            for _c in comps_to_update:
-                try:
-                    _c.stock_threshold = stock_to_propagate
-                    _c.replenishment_qty = repl_to_propagate
-                except Exception:
-                    pass
-            db.session.commit()
+            _update_node_components(s.id, pc_id_param, return_to_param, {
+                ProductComponent.stock_threshold: stock_to_propagate,
+                ProductComponent.replenishment_qty: repl_to_propagate,
+            })
         except Exception:
-            db.session.rollback()
+            pass
         # -----------------------------------------------------------------
         # Propagate updated master attributes to all structures sharing the
         # same component code.  When editing defaults for one node, other
@@ -2306,14 +2776,17 @@ def define_structure_node_defaults(node_id: int):
                 other.price_per_unit = master.price_per_unit
                 other.minimum_order_qty = master.minimum_order_qty
                 other.notes = master.notes
-            if others:
-                try:
-                    db.session.commit()
-                except Exception:
-                    db.session.rollback()
         except Exception:
             # Silently ignore propagation errors
             pass
+        # Persist the compatibility selection, flags, quantity, attributes and
+        # their propagation in a single transaction.
+        try:
+            db.session.commit()
+            flash('Attributi del nodo salvati.', 'success')
+        except Exception:
+            db.session.rollback()
+            flash('Errore durante il salvataggio degli attributi del nodo.', 'danger')
         # After saving attributes and propagating them, remain on the definition
         # page if the user arrived from a product context.  Otherwise return
         # to the structures overview.  Preserve the return_to parameter on the
@@ -2324,9 +2797,7 @@ def define_structure_node_defaults(node_id: int):
     # On GET, present a page identical to the product component editing view.  Construct
     # a dummy product and component so the existing template can be reused.  This
     # allows administrators to define defaults in a familiar environment.
-    suppliers = Supplier.query.order_by(Supplier.name.asc()).all()
-    work_centers = WorkCenter.query.order_by(WorkCenter.name.asc()).all()
-    work_phases = WorkPhase.query.order_by(WorkPhase.name.asc()).all()
+    suppliers, work_centers, work_phases = _catalog()
 
     dummy_product = SimpleNamespace(id=0, name=f"Definizione {s.name}")
     # For node defaults use the actual structure as the component's structure.  The
@@ -2335,13 +2806,11 @@ def define_structure_node_defaults(node_id: int):
     # the master.  This ensures that when editing defaults for a node whose
     # code already exists globally (e.g. "P001-025-001B") the form shows the
     # canonical information rather than empty fields.
-    dummy_component = SimpleNamespace()
-    dummy_component.structure = s
     # Default quantity is 1.  When editing from a product context (return_to
     # provided), attempt to prefill the quantity from the corresponding
     # ProductComponent for that product.  Otherwise leave at 1 because
     # default definitions do not track a quantity.
-    dummy_component.quantity = 1
+    dummy_component = _DefaultsComponent(structure=s, quantity=1)
     # Prefer values from the component master when available
     master = getattr(s, 'component_master', None)
     # Description and notes
@@ -2458,8 +2927,7 @@ def define_structure_node_defaults(node_id: int):
             pass
     elif return_to_param:
         try:
-            import re
-            match = re.search(r"/products/(\d+)", return_to_param)
+            match = _PRODUCT_ID_RE.search(return_to_param)
             if match:
                 prod_id = int(match.group(1))
                 comp = ProductComponent.query.filter_by(product_id=prod_id, structure_id=s.id).first()
@@ -2468,45 +2936,31 @@ def define_structure_node_defaults(node_id: int):
         except Exception:
             pass
 
-    # Determine if there is a master image for this node to display in the
-    # component detail template.  A master image has the prefix "cm_<id>_" in
-    # the static uploads directory.  If found, store the filename for the
-    # template.  If no master or no file is found, leave as None.
+    # Images and timestamps are None for default definitions.  A default image
+    # saved for this node via the defaults form is stored under static/uploads
+    # with the prefix ``sn_<node_id>_``; the template shows it in preference
+    # to the master image (prefix ``cm_<master id>_``), so the uploads folder
+    # is only searched for the master image when the node has none.  When
+    # neither exists the template displays "Nessuna immagine".
     master_image_filename = None
+    upload_dir = os.path.join(static_folder, 'uploads')
     try:
-        m = getattr(s, 'component_master', None)
-        if m:
-            upload_dir = os.path.join(current_app.static_folder, 'uploads')
-            if os.path.isdir(upload_dir):
-                prefix = f"cm_{m.id}_"
-                for f in os.listdir(upload_dir):
-                    if f.startswith(prefix):
-                        master_image_filename = f
-                        break
-    except Exception:
-        master_image_filename = None
-    # Image and timestamps are None for default definitions
-    # Determine if a default image has been saved for this node.  Images
-    # uploaded via the defaults form are stored under static/uploads with a
-    # prefix ``sn_<node_id>_``.  Search for the first matching file and
-    # assign its name to image_filename.  When no image exists, set to None
-    # so the template displays "Nessuna immagine".
-    dummy_component.image_filename = None
-    try:
-        upload_dir = os.path.join(current_app.static_folder, 'uploads')
-        prefix = f"sn_{s.id}_"
         if os.path.isdir(upload_dir):
-            for _fname in os.listdir(upload_dir):
-                if _fname.startswith(prefix):
-                    dummy_component.image_filename = _fname
-                    break
+            dummy_component.image_filename = _first_upload(upload_dir, f"sn_{s.id}_")
     except Exception:
         dummy_component.image_filename = None
+    if not dummy_component.image_filename:
+        try:
+            m = getattr(s, 'component_master', None)
+            if m and os.path.isdir(upload_dir):
+                master_image_filename = _first_upload(upload_dir, f"cm_{m.id}_")
+        except Exception:
+            master_image_filename = None
     dummy_component.created_at = None
     dummy_component.updated_at = None
     # Resolve related work centre if available
     if dummy_component.work_center_id:
-        dummy_component.work_center = WorkCenter.query.get(dummy_component.work_center_id)
+        dummy_component.work_center = _work_center(dummy_component.work_center_id)
     else:
         dummy_component.work_center = None
     # Compute processing cost for internal processing if missing
@@ -2522,7 +2976,6 @@ def define_structure_node_defaults(node_id: int):
     additional_cycles: list = []
     if category == 'part':
         try:
-            import json
             if dummy_component.notes:
                 parsed = json.loads(dummy_component.notes)
                 if isinstance(parsed, dict) and 'cycles' in parsed:
@@ -2536,113 +2989,63 @@ def define_structure_node_defaults(node_id: int):
         # to display a meaningful value.  Use dummy_component values for primary
         # cycle and the extracted cycles for additional cycles.
         if dummy_component.processing_cost is None:
-            total_cost = 0.0
-            # Primary cost: internal only
-            if dummy_component.processing_type == 'internal' and dummy_component.standard_time is not None and dummy_component.work_center_id:
-                wc_obj = WorkCenter.query.get(dummy_component.work_center_id)
-                if wc_obj and wc_obj.hourly_cost is not None:
-                    try:
-                        total_cost += (dummy_component.standard_time / 60.0) * float(wc_obj.hourly_cost)
-                    except Exception:
-                        pass
-            # Additional cycles costs
-            for cycle in additional_cycles:
-                try:
-                    ctype = cycle.get('processing_type')
-                    if ctype == 'internal':
-                        st = cycle.get('standard_time')
-                        wc_id = cycle.get('work_center_id')
-                        if st and wc_id:
-                            try:
-                                st_float = float(st)
-                                wc_obj = WorkCenter.query.get(int(wc_id))
-                                if wc_obj and wc_obj.hourly_cost is not None:
-                                    total_cost += st_float * float(wc_obj.hourly_cost)
-                            except Exception:
-                                pass
-                    elif ctype == 'external':
-                        cost_str = cycle.get('processing_cost')
-                        if cost_str:
-                            try:
-                                total_cost += float(cost_str)
-                            except (ValueError, TypeError):
-                                pass
-                except Exception:
-                    pass
-            dummy_component.processing_cost = total_cost if total_cost > 0 else None
+            dummy_component.processing_cost = _aggregated_cost(
+                dummy_component.processing_type,
+                dummy_component.standard_time / 60.0 if dummy_component.standard_time is not None else None,
+                dummy_component.work_center_id,
+                additional_cycles,
+            )
     # Build a mapping of existing documents for this node.  Uploaded documents
     # for structure nodes are stored under static/tmp_structures/<type>/<node path>/<folder>.
     existing_documents: dict[str, list[dict]] = {}
     # Determine the document folders for the category
-    if category == 'part':
-        doc_folders = ['qualita', '3_1_materiale', 'step_tavole', 'altro']
-    elif category == 'assembly':
-        doc_folders = ['qualita', 'step_tavole', 'funzionamento', 'istruzioni', 'altro']
-    else:
-        doc_folders = ['qualita', 'ddt_fornitore', 'step_tavole', '3_1_materiale', 'altro']
+    doc_folders = _DOC_FOLDERS_BY_CATEGORY[category]
     # Build the base path for documents.  Prefer the master path when available.
-    def _safe(name: str) -> str:
-        return secure_filename(name) or 'unnamed'
+    _safe = _safe_path_component
     master = getattr(s, 'component_master', None)
     base_path: str | None = None
     if master:
         try:
-            base_path = os.path.join(current_app.static_folder, 'tmp_components', _safe(master.code))
+            base_path = os.path.join(static_folder, 'tmp_components', _safe(master.code))
         except Exception:
             base_path = None
     if not base_path:
         # Fallback to tmp_structures path (legacy)
         type_dir = _safe(s.type.name)
         struct_parts: list[str] = []
-        def _collect(node):
-            if node.parent:
-                _collect(node.parent)
-            struct_parts.append(_safe(node.name))
-        _collect(s)
-        base_path = os.path.join(current_app.static_folder, 'tmp_structures', type_dir, *struct_parts)
+        # Root-to-node names from a single recursive query
+        struct_parts.extend(_safe(name) for name in _ancestor_names(s))
+        base_path = os.path.join(static_folder, 'tmp_structures', type_dir, *struct_parts)
     # For each folder gather files relative to appropriate base path
     for folder in doc_folders:
         files: list[dict] = []
         folder_path = os.path.join(base_path, folder)
+        # ``scandir`` reports the entry type without a stat per file; a
+        # missing folder simply raises and leaves the list empty.
         try:
-            if os.path.isdir(folder_path):
-                for fname in os.listdir(folder_path):
-                    full_path = os.path.join(folder_path, fname)
-                    if os.path.isfile(full_path):
+            with os.scandir(folder_path) as it:
+                for entry in it:
+                    if entry.is_file():
+                        fname = entry.name
                         # Build relative path for links.  Use different base directories
                         # depending on whether the path is tmp_components or tmp_structures.
                         if 'tmp_components' in base_path:
                             rel_path = os.path.join('tmp_components', _safe(master.code) if master else '', folder, fname)
                         else:
-                            # Legacy structure path relative part
-                            type_dir = _safe(s.type.name)
-                            struct_parts: list[str] = []
-                            def _collect_rel(node):
-                                if node.parent:
-                                    _collect_rel(node.parent)
-                                struct_parts.append(_safe(node.name))
-                            _collect_rel(s)
+                            # Legacy structure path relative part, reusing the
+                            # type_dir/struct_parts computed for the fallback above
                             rel_path = os.path.join('tmp_structures', type_dir, *struct_parts, folder, fname)
                         files.append({'name': fname, 'path': rel_path})
         except Exception:
             pass
         existing_documents[folder] = files
-    doc_label_map: dict[str, str] = {
-        'qualita': 'Modulo Cert. qualità',
-        '3_1_materiale': '3.1 Materiale',
-        'step_tavole': 'Step/tavola',
-        'funzionamento': 'Verifica funzionamento',
-        'istruzioni': 'Montaggio istruzioni',
-        'ddt_fornitore': 'DDT fornitore',
-        'altro': 'Altro',
-    }
+    doc_label_map = _DOC_LABEL_MAP
     # Extract a plain notes value for the template.  The notes field may
     # contain JSON when cycles are stored, similar to ProductComponent notes.
     # Attempt to parse JSON and extract the 'notes' key; otherwise use the
     # raw string.  If parsing fails fall back to the original value.
     notes_value = ''
     try:
-        import json
         if dummy_component.notes:
             parsed = json.loads(dummy_component.notes)
             if isinstance(parsed, dict) and 'notes' in parsed:
@@ -2727,11 +3130,10 @@ def define_structure_node_defaults(node_id: int):
     lot_management_flag = False
     if category == 'commercial':
         try:
-            import json as _json
             # First look at dummy_component.notes which may be a JSON string or plain text
             if getattr(dummy_component, 'notes', None):
                 try:
-                    parsed_lot = _json.loads(dummy_component.notes)
+                    parsed_lot = json.loads(dummy_component.notes)
                     if isinstance(parsed_lot, dict) and 'lot_management' in parsed_lot:
                         lot_management_flag = bool(parsed_lot.get('lot_management'))
                 except Exception:
@@ -2742,7 +3144,7 @@ def define_structure_node_defaults(node_id: int):
                 m = getattr(s, 'component_master', None)
                 if m and m.notes:
                     try:
-                        parsed_m = _json.loads(m.notes)
+                        parsed_m = json.loads(m.notes)
                         if isinstance(parsed_m, dict) and 'lot_management' in parsed_m:
                             lot_management_flag = bool(parsed_m.get('lot_management'))
                     except Exception:
@@ -2750,7 +3152,7 @@ def define_structure_node_defaults(node_id: int):
             # Fallback to structure notes if still not found
             if not lot_management_flag and s.notes:
                 try:
-                    parsed_s = _json.loads(s.notes)
+                    parsed_s = json.loads(s.notes)
                     if isinstance(parsed_s, dict) and 'lot_management' in parsed_s:
                         lot_management_flag = bool(parsed_s.get('lot_management'))
                 except Exception:
@@ -2771,30 +3173,8 @@ def define_structure_node_defaults(node_id: int):
             struct_id = None
         if struct_id is not None and str(struct_id) in cl_map:
             raw_paths = cl_map.get(str(struct_id), []) or []
-            norm_set: set[str] = set()
-            for p in raw_paths:
-                if not isinstance(p, str):
-                    continue
-                try:
-                    norm = p.replace('\\', '/').strip()
-                except Exception:
-                    norm = p
-                if norm:
-                    norm_set.add(norm)
-            flagged_docs = norm_set
-            # Build filename and base name sets for flexible matching
-            flagged_filenames: set[str] = set()
-            flagged_basenames: set[str] = set()
-            for path in norm_set:
-                parts = path.split('/')
-                if parts:
-                    fname = parts[-1]
-                    fname_lower = str(fname).lower()
-                    flagged_filenames.add(fname_lower)
-                    base_no_ext = fname_lower.rsplit('.', 1)[0]
-                    base_original = base_no_ext.split('_compiled_')[0]
-                    if base_original:
-                        flagged_basenames.add(base_original)
+            # Normalised paths plus lower-case file and base names for matching
+            flagged_docs, flagged_filenames, flagged_basenames = _flagged_doc_sets(raw_paths)
         else:
             flagged_docs = set()
             flagged_filenames = set()
@@ -2953,6 +3333,7 @@ def dictionary():
             if name and not Supplier.query.filter_by(name=name).first():
                 db.session.add(Supplier(name=name))
                 db.session.commit()
+                _invalidate_catalog()
                 flash('Fornitore aggiunto.', 'success')
         elif category == 'work_center':
             # Aggiungi un nuovo centro di lavoro con nome e costo orario facoltativo
@@ -2966,12 +3347,14 @@ def dictionary():
             if name and not WorkCenter.query.filter_by(name=name).first():
                 db.session.add(WorkCenter(name=name, hourly_cost=cost))
                 db.session.commit()
+                _invalidate_catalog()
                 flash('Centro di lavoro aggiunto.', 'success')
         elif category == 'work_phase':
             name = request.form.get('name', '').strip()
             if name and not WorkPhase.query.filter_by(name=name).first():
                 db.session.add(WorkPhase(name=name))
                 db.session.commit()
+                _invalidate_catalog()
                 flash('Fase di lavorazione aggiunta.', 'success')
         elif category == 'material_cost':
             material = request.form.get('material', '').strip()
@@ -3033,6 +3416,7 @@ def edit_supplier(supplier_id: int):
             else:
                 supplier.name = name
                 db.session.commit()
+                _invalidate_catalog()
                 flash('Fornitore aggiornato.', 'success')
                 return redirect(url_for('admin.dictionary'))
     return render_template('admin/edit_supplier.html', supplier=supplier)
@@ -3056,6 +3440,7 @@ def delete_supplier(supplier_id: int):
     else:
         db.session.delete(supplier)
         db.session.commit()
+        _invalidate_catalog()
         flash('Fornitore eliminato.', 'success')
     return redirect(url_for('admin.dictionary'))
 
@@ -3093,6 +3478,7 @@ def edit_work_center(center_id: int):
                 center.name = name
                 center.hourly_cost = cost
                 db.session.commit()
+                _invalidate_catalog()
                 flash('Centro di lavoro aggiornato.', 'success')
                 return redirect(url_for('admin.dictionary'))
     return render_template('admin/edit_work_center.html', center=center)
@@ -3114,6 +3500,7 @@ def delete_work_center(center_id: int):
     else:
         db.session.delete(center)
         db.session.commit()
+        _invalidate_catalog()
         flash('Centro di lavoro eliminato.', 'success')
     return redirect(url_for('admin.dictionary'))
 
@@ -3142,6 +3529,7 @@ def edit_work_phase(phase_id: int):
             else:
                 phase.name = name
                 db.session.commit()
+                _invalidate_catalog()
                 flash('Fase di lavorazione aggiornata.', 'success')
                 return redirect(url_for('admin.dictionary'))
     return render_template('admin/edit_work_phase.html', phase=phase)
@@ -3163,6 +3551,7 @@ def delete_work_phase(phase_id: int):
     else:
         db.session.delete(phase)
         db.session.commit()
+        _invalidate_catalog()
         flash('Fase di lavorazione eliminata.', 'success')
     return redirect(url_for('admin.dictionary'))
 
@@ -3529,44 +3918,34 @@ def import_structure():
                         upload_dir = os.path.join(current_app.static_folder, 'uploads')
                         if os.path.isdir(upload_dir):
                             prefix_src = f"sn_{existing_global.id}_"
-                            src_file = None
-                            for _f in os.listdir(upload_dir):
-                                if _f.startswith(prefix_src):
-                                    src_file = _f
-                                    break
+                            src_file = next(iter(_uploads_by_struct(upload_dir).get(existing_global.id, ())), None)
                             if src_file:
                                 suffix = src_file[len(prefix_src):]
                                 src_path = os.path.join(upload_dir, src_file)
                                 dest_name = f"sn_{struct.id}_{suffix}"
                                 dest_path = os.path.join(upload_dir, dest_name)
                                 try:
-                                    shutil.copyfile(src_path, dest_path)
+                                    _fastcopy(src_path, dest_path)
                                 except Exception:
                                     pass
+                                _invalidate_uploads_index()
                         # Replicate documents directory from existing_global to struct
-                        def _safe_name(n: str) -> str:
-                            return secure_filename(n) or 'unnamed'
+                        _safe_name = _safe_path_component
                         type_dir_src = _safe_name(existing_global.type.name)
                         parts_src: list[str] = []
-                        def _collect_src(node_obj):
-                            if node_obj.parent:
-                                _collect_src(node_obj.parent)
-                            parts_src.append(_safe_name(node_obj.name))
-                        _collect_src(existing_global)
+                        # Root-to-node names from a single recursive query
+                        parts_src.extend(_safe_name(name) for name in _ancestor_names(existing_global))
                         base_src = os.path.join(current_app.static_folder, 'tmp_structures', type_dir_src, *parts_src)
                         if os.path.isdir(base_src):
                             type_dir_dst = _safe_name(struct.type.name)
                             parts_dst: list[str] = []
-                            def _collect_dst(node_obj):
-                                if node_obj.parent:
-                                    _collect_dst(node_obj.parent)
-                                parts_dst.append(_safe_name(node_obj.name))
-                            _collect_dst(struct)
+                            # Root-to-node names from a single recursive query
+                            parts_dst.extend(_safe_name(name) for name in _ancestor_names(struct))
                             base_dst = os.path.join(current_app.static_folder, 'tmp_structures', type_dir_dst, *parts_dst)
                             try:
                                 if os.path.isdir(base_dst):
                                     shutil.rmtree(base_dst)
-                                shutil.copytree(base_src, base_dst)
+                                shutil.copytree(base_src, base_dst, copy_function=_fastcopy)
                             except Exception:
                                 pass
                     except Exception:
@@ -3706,7 +4085,7 @@ def import_images():
         try:
             with tempfile.TemporaryDirectory() as tmpdir:
                 archive_path = os.path.join(tmpdir, filename)
-                file.save(archive_path)
+                file.save(archive_path, buffer_size=_COPY_BUFSIZE)
                 # Extract contents of the archive
                 try:
                     with zipfile.ZipFile(archive_path, 'r') as zf:
@@ -3714,9 +4093,6 @@ def import_images():
                 except Exception:
                     flash("Impossibile estrarre l'archivio.", 'danger')
                     return redirect(url_for('admin.import_images'))
-                # Helper to validate image extensions
-                def _allowed_image(fname: str) -> bool:
-                    return '.' in fname and fname.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
                 upload_dir = os.path.join(current_app.static_folder, 'uploads')
                 os.makedirs(upload_dir, exist_ok=True)
                 imported_count = 0
@@ -3732,8 +4108,13 @@ def import_images():
                         code = os.path.splitext(fname)[0].strip()
                         if not code:
                             continue
-                        # Find structures by name (code)
-                        structs = Structure.query.filter_by(name=code).all()
+                        # Find structures by name (code).  Load the type with
+                        # the same query: ensure_component_master_for_structure
+                        # needs its name to locate each node's documents.
+                        structs = (Structure.query
+                                   .options(joinedload(Structure.type))
+                                   .filter_by(name=code)
+                                   .all())
                         if not structs:
                             unmatched.append(fname)
                             continue
@@ -3748,10 +4129,11 @@ def import_images():
                             dest_name = dest_prefix + secure_filename(fname)
                             dest_path = os.path.join(upload_dir, dest_name)
                             try:
-                                shutil.copyfile(src_path, dest_path)
+                                _fastcopy(src_path, dest_path)
                                 imported_count += 1
                             except Exception:
                                 pass
+                        _invalidate_uploads_index()
                 # Commit any masters created during import
                 try:
                     db.session.commit()
@@ -3969,7 +4351,7 @@ def edit_structure_node(node_id: int):
     admin_required()
     node = Structure.query.get_or_404(node_id)
     types = StructureType.query.order_by(StructureType.name.asc()).all()
-    nodes_by_type = {t.id: t.nodes.order_by(Structure.name.asc()).all() for t in types}
+    nodes_by_type = _nodes_by_type(types)
 
     if request.method == 'POST':
         name = request.form.get('node_name', '').strip()
@@ -18,8 +18,12 @@ from ...models import (
 # Import checklist helpers
 from ...checklist import load_checklist, toggle_flag
 
-# Import helper to create or attach a ComponentMaster for a structure.
-from ..admin.routes import ensure_component_master_for_structure
+# Import helpers to create or attach a ComponentMaster for a structure and
+# to build (memoised) safe folder names.
+from ..admin.routes import (
+    ensure_component_master_for_structure, _safe_path_component, _allowed_image, _catalog,
+    _nodes_by_type,
+)
 
 from sqlalchemy import or_, func
 import shutil  # For copying uploaded documents into multiple destinations
@@ -211,24 +215,8 @@ def revise_structure(structure_id: int):
     specified in the ``next`` query parameter or to the component
     detail page if unspecified.
     """
-    # Ensure the revision and compatible_revisions columns exist on the
-    # structures table.  Some older databases may lack these columns
-    # because migrations are performed dynamically.  Use PRAGMA table_info
-    # and ALTER TABLE statements to add the columns when missing.  This
-    # check runs quickly and does nothing if the columns already exist.
-    try:
-        from sqlalchemy import text
-        conn = db.engine.connect()
-        cols = [row[1] for row in conn.execute(text('PRAGMA table_info(structures)')).fetchall()]
-        if 'revision' not in cols:
-            conn.execute(text('ALTER TABLE structures ADD COLUMN revision INTEGER DEFAULT 0'))
-        if 'compatible_revisions' not in cols:
-            conn.execute(text('ALTER TABLE structures ADD COLUMN compatible_revisions TEXT'))
-        conn.close()
-    except Exception:
-        # Ignore any errors; the columns may already exist or be added via admin helpers
-        pass
-
+    # The revision and compatible_revisions columns are added to older
+    # databases by the start-up schema upgrade (see ``REQUIRED_COLUMNS``).
     structure = Structure.query.get_or_404(structure_id)
     # Increment the revision index (default to 0 if None)
     try:
@@ -476,16 +464,13 @@ def edit(id: int):
         max_pressure_from_val = _parse_float(request.form.get('max_pressure_from'))
         max_pressure_to_val = _parse_float(request.form.get('max_pressure_to'))
 
-        def allowed_file(filename: str) -> bool:
-            return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-
         if not name:
             flash('Il nome del prodotto è obbligatorio.', 'danger')
         else:
             product.name = name
             product.description = description
             # If a new image was uploaded, save it and update filename
-            if image_file and allowed_file(image_file.filename):
+            if image_file and _allowed_image(image_file.filename):
                 filename = secure_filename(image_file.filename)
                 filename = f"{product.id}_{filename}"
                 upload_dir = os.path.join(current_app.static_folder, 'uploads')
@@ -523,7 +508,7 @@ def edit(id: int):
                 product.max_pressure_to = max_pressure_to_val
 
             # Save the curve image if provided
-            if curve_file and allowed_file(curve_file.filename):
+            if curve_file and _allowed_image(curve_file.filename):
                 curve_filename = secure_filename(curve_file.filename)
                 curve_filename = f"{product.id}_curve_{curve_filename}"
                 upload_dir = os.path.join(current_app.static_folder, 'uploads')
@@ -1267,14 +1252,16 @@ def category_table(product_id: int, category: str):
         doc_folders = ['qualita', 'step_tavole', 'funzionamento', 'istruzioni', 'altro']
     else:
         doc_folders = ['qualita', 'ddt_fornitore', 'step_tavole', '3_1_materiale', 'altro']
-    def _safe(name: str) -> str:
-        return secure_filename(name) or 'unnamed'
+    _safe = _safe_path_component
     prod_dir = _safe(product.name)
-    # Helper to collect the structure path for a node
+    # Helper to collect the structure path for a node: walk up to the root
+    # iteratively and reverse once.
     def _collect_path(node, parts):
-        if node.parent:
-            _collect_path(node.parent, parts)
-        parts.append(_safe(node.name))
+        chain = []
+        while node is not None:
+            chain.append(_safe(node.name))
+            node = node.parent
+        parts.extend(reversed(chain))
     for comp in components:
         entries: dict[str, list[dict]] = {}
         struct_parts: list[str] = []
@@ -1406,17 +1393,9 @@ def category_table(product_id: int, category: str):
         # for flagged documents.  This allows the UI to treat compiled
         # versions of flagged documents as flagged as well.
         flagged_basenames: set[str] = set()
-        for p in flagged_list:
-            # Normalise each stored path by converting backslashes to forward slashes
-            # and trimming whitespace.  Skip any non-string entries or empty strings.
-            if not isinstance(p, str):
-                continue
-            try:
-                norm = p.replace('\\', '/').strip()
-            except Exception:
-                norm = p
-            if not norm:
-                continue
+        # load_checklist() returns non-empty paths already normalised to
+        # forward slashes.
+        for norm in flagged_list:
             parts = norm.split('/')
             if len(parts) >= 2:
                 folder = parts[-2]
@@ -1530,23 +1509,9 @@ def category_table(product_id: int, category: str):
         # component's documents_map (e.g. under tmp_components or tmp_structures),
         # it may not appear in doc_entries.  By adding the stored path to
         # matches, the template will still recognise it when comparing
-        # against file.path values.  Normalise each stored path by replacing
-        # backslashes with forward slashes and stripping whitespace to
-        # maintain consistency with toggle_flag() semantics.
-        for p in flagged_list:
-            # Include each stored path directly in the matches set so that
-            # checkboxes remain selected even when the corresponding file is
-            # located outside of documents_map (e.g. default documents).  To
-            # normalise the path consistently across platforms, replace
-            # single backslashes with forward slashes and strip whitespace.
-            if not isinstance(p, str):
-                continue
-            try:
-                norm = p.replace('\\', '/').strip()
-            except Exception:
-                norm = p
-            if norm:
-                matches.add(norm)
+        # against file.path values.  load_checklist() has already normalised
+        # the stored paths the same way toggle_flag() does.
+        matches.update(flagged_list)
         flagged_docs_map[comp.id] = matches
         # Save the per-component flagged filename and base name sets for template use
         flagged_filenames_map[comp.id] = flagged_filenames
@@ -1759,33 +1724,8 @@ def component_detail(product_id: int, component_id: int):
         except Exception:
             pass
     if request.method == 'POST':
-        # ---------------------------------------------------------------------
-        # Ensure the revision and compatible_revisions columns exist on the
-        # structures table before attempting to read or write these fields.
-        # Older databases may not include these columns and will silently
-        # discard changes if they are not present.  This dynamic check
-        # mirrors the logic in the revise_structure endpoint and avoids
-        # migrations in environments where Alembic is not used.
-        try:
-            from sqlalchemy import text
-            conn = db.engine.connect()
-            col_names = [row[1] for row in conn.execute(text('PRAGMA table_info(structures)')).fetchall()]
-            # Add revision column if missing (defaults to 0 so existing rows
-            # appear without a revision until explicitly revised).
-            if 'revision' not in col_names:
-                conn.execute(text('ALTER TABLE structures ADD COLUMN revision INTEGER DEFAULT 0'))
-            # Add compatible_revisions column if missing.  This stores a
-            # comma‑separated list of prior revision labels selected as
-            # compatible with the current revision.  When absent, any
-            # assignments to struct.compatible_revisions would be ignored.
-            if 'compatible_revisions' not in col_names:
-                conn.execute(text('ALTER TABLE structures ADD COLUMN compatible_revisions TEXT'))
-            conn.close()
-        except Exception:
-            # Ignore any error; if the columns already exist or cannot be
-            # added the subsequent assignment will simply update the model
-            # attribute in memory.
-            pass
+        # The revision and compatible_revisions columns are added to older
+        # databases by the start-up schema upgrade (see ``REQUIRED_COLUMNS``).
         # Ensure this component has a master.  Creating or retrieving the master
         # before handling uploads ensures images and documents are stored under
         # the correct global directory.  The helper gracefully handles cases
@@ -1901,9 +1841,7 @@ def component_detail(product_id: int, component_id: int):
         # component.  Master images use the ``cm_<id>_`` prefix and are shared
         # globally; fallback images use the component id prefix.
         image_file = request.files.get('image')
-        def allowed_file(filename: str) -> bool:
-            return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-        if image_file and allowed_file(image_file.filename):
+        if image_file and _allowed_image(image_file.filename):
             raw_name = secure_filename(image_file.filename)
             upload_dir = os.path.join(current_app.static_folder, 'uploads')
             os.makedirs(upload_dir, exist_ok=True)
@@ -1965,8 +1903,7 @@ def component_detail(product_id: int, component_id: int):
         docs_uploaded = False
         if doc_fields:
             # Helper to sanitize names for safe directory names
-            def _safe(n: str) -> str:
-                return secure_filename(n) or 'unnamed'
+            _safe = _safe_path_component
             # Determine base directory: prefer tmp_components/<code> when a
             # component master exists; otherwise fall back to the legacy
             # documents/<product>/<structure path> location.  When the
@@ -2512,9 +2449,7 @@ def component_detail(product_id: int, component_id: int):
         # Assemblies are read‑only; no update occurs
         return redirect(url_for('products.component_detail', product_id=product_id, component_id=component_id))
     # Prepare dictionary lists for selects
-    suppliers = Supplier.query.order_by(Supplier.name.asc()).all()
-    work_centers = WorkCenter.query.order_by(WorkCenter.name.asc()).all()
-    work_phases = WorkPhase.query.order_by(WorkPhase.name.asc()).all()
+    suppliers, work_centers, work_phases = _catalog()
     # When displaying a part component, attempt to extract any additional
     # processing cycles from the notes field.  If the notes field contains
     # a JSON object with keys "notes" and "cycles", assign the cycles to
@@ -2594,15 +2529,14 @@ def component_detail(product_id: int, component_id: int):
         doc_folders = ['qualita', 'step_tavole', 'funzionamento', 'istruzioni', 'altro']
     else:
         doc_folders = ['qualita', 'ddt_fornitore', 'step_tavole', '3_1_materiale', 'altro']
-    def _safe(name: str) -> str:
-        return secure_filename(name) or 'unnamed'
+    _safe = _safe_path_component
     prod_dir = _safe(product.name)
     struct_path_parts: list[str] = []
-    def _collect_path(node):
-        if node.parent:
-            _collect_path(node.parent)
+    node = struct
+    while node is not None:
         struct_path_parts.append(_safe(node.name))
-    _collect_path(struct)
+        node = node.parent
+    struct_path_parts.reverse()
     base_path = os.path.join(current_app.static_folder, 'documents', prod_dir, *struct_path_parts)
     # When the structure has a non‑empty revision label, prefer a
     # revision‑specific folder for documents.  The revision folder is
@@ -2735,17 +2669,9 @@ def component_detail(product_id: int, component_id: int):
             flagged_names: set[tuple[str, str]] = set()
             flagged_filenames: set[str] = set()
             flagged_basenames: set[str] = set()
-            for p in raw_paths:
-                # Normalise each stored path by converting backslashes to forward slashes
-                # and trimming whitespace.  Skip any non-string entries or empty strings.
-                if not isinstance(p, str):
-                    continue
-                try:
-                    norm = p.replace('\\', '/').strip()
-                except Exception:
-                    norm = p
-                if not norm:
-                    continue
+            # load_checklist() returns non-empty paths already normalised to
+            # forward slashes.
+            for norm in raw_paths:
                 parts = norm.split('/')
                 if len(parts) >= 2:
                     folder = parts[-2]
@@ -2838,17 +2764,9 @@ def component_detail(product_id: int, component_id: int):
             # Additionally, include any stored paths themselves.  This allows
             # flags referring to default documents in tmp_components or
             # tmp_structures to remain selected when those files are not
-            # present in the per-product documents list.  Normalise the
-            # stored paths before adding.
-            for p in raw_paths:
-                if not isinstance(p, str):
-                    continue
-                try:
-                    norm = p.replace('\\', '/').strip()
-                except Exception:
-                    norm = p
-                if norm:
-                    matches.add(norm)
+            # present in the per-product documents list.  The stored paths
+            # are already normalised by load_checklist().
+            matches.update(raw_paths)
             flagged_docs = matches
             # Capture the per-structure flagged filenames and base names for the template.
             flagged_filenames_lower = flagged_filenames
@@ -2900,8 +2818,6 @@ def create():
         selected_components = request.form.getlist('components')
         # Handle uploaded image
         image_file = request.files.get('image')
-        def allowed_file(filename: str) -> bool:
-            return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
         if not name:
             flash('Il nome del prodotto è obbligatorio.', 'danger')
@@ -3012,7 +2928,7 @@ def create():
                 db.session.add(comp)
             db.session.commit()
             # Process image upload after the product has an id
-            if image_file and allowed_file(image_file.filename):
+            if image_file and _allowed_image(image_file.filename):
                 filename = secure_filename(image_file.filename)
                 # Prepend product id to ensure uniqueness
                 filename = f"{product.id}_{filename}"
@@ -3028,7 +2944,8 @@ def create():
     # On GET or validation errors, render form
     # Group structures by their type for easier display in the form
     types = StructureType.query.order_by(StructureType.name.asc()).all()
-    nodes_by_type = {t.id: Structure.query.filter_by(type_id=t.id).order_by(Structure.name.asc()).all() for t in types}
+    # One query for all nodes, grouped by type in Python
+    nodes_by_type = _nodes_by_type(types)
     return render_template('products/create.html', types=types, nodes_by_type=nodes_by_type)
 
 @products_bp.route('/<int:id>')
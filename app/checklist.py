@@ -25,7 +25,8 @@ list is empty, no documents are required for that component.
 
 These helpers handle file creation, JSON parsing and persistence.
 If the checklist file does not exist it is created automatically
-with an empty dictionary.
+with an empty dictionary.  The parsed checklist is kept in memory and
+only re-read when the file's modification time or size changes.
 """
 
 from __future__ import annotations
@@ -36,6 +37,12 @@ from typing import Dict, List, Set
 
 from flask import current_app
 
+# Parsed checklist of the last file read, as ``((path, mtime_ns, size),
+# mapping)``; stored as one tuple so concurrent readers never see a key with
+# another file's data.  ``load_checklist`` returns a copy so callers can
+# modify the result (``toggle_flag`` does) without touching the cache.
+_cache: Dict[str, object] = {'entry': None}
+
 
 def _get_checklist_path() -> str:
     """Return the absolute path to the checklist JSON file.
@@ -55,10 +62,29 @@ def load_checklist() -> Dict[str, List[str]]:
     """Load the document checklist from disk.
 
     Returns a mapping of structure ID (as string) to a list of
-    relative document paths.  If the file cannot be read or parsed
-    the function returns an empty dictionary.
+    relative document paths.  The paths are already normalised: non-empty,
+    stripped, with forward slashes and without duplicates, so callers can
+    use them as-is.  If the file cannot be read or parsed the function
+    returns an empty dictionary.
     """
     path = _get_checklist_path()
+    try:
+        st = os.stat(path)
+    except OSError:
+        # If the file doesn't exist, return an empty mapping
+        return {}
+    key = (path, st.st_mtime_ns, st.st_size)
+    entry = _cache['entry']
+    if entry is not None and entry[0] == key:
+        data = entry[1]
+    else:
+        data = _read_checklist(path)
+        _cache['entry'] = (key, data)
+    return {k: list(v) for k, v in data.items()}
+
+
+def _read_checklist(path: str) -> Dict[str, List[str]]:
+    """Parse and normalise the checklist file at ``path`` (uncached)."""
     try:
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -129,6 +155,8 @@ def save_checklist(data: Dict[str, List[str]]) -> None:
             norm_data[k] = new_list
         with open(path, "w", encoding="utf-8") as f:
             json.dump(norm_data, f, indent=2)
+        # Coarse file timestamps may not change between two quick writes
+        _cache['entry'] = None
     except Exception:
         # Ignore I/O errors
         pass
@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
 
 # Carica automaticamente variabili da .env se presente
 load_dotenv()
@@ -29,6 +30,63 @@ class Config:
     db_filename = os.path.join('instance', 'app.db')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(BASE_DIR, db_filename)
 
+    # SQLite allows a single writer at a time, so the default pool of up to
+    # 15 connections only produces "database is locked" retries under
+    # concurrent writes.  Keep one persistent connection with a few overflow
+    # connections for concurrent readers (WAL mode) and wait up to five
+    # seconds for a lock.  In-memory databases (``sqlite://``,
+    # ``sqlite:///:memory:``) use SQLAlchemy's ``SingletonThreadPool``, which
+    # does not accept the pool sizing, so they only get the connect args.
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'connect_args': {'check_same_thread': False, 'timeout': 5},
+        }
+        _database = make_url(SQLALCHEMY_DATABASE_URI).database
+        if _database and _database != ':memory:' and 'mode=memory' not in SQLALCHEMY_DATABASE_URI:
+            SQLALCHEMY_ENGINE_OPTIONS.update(pool_size=1, max_overflow=4)
+    else:
+        # Client/server databases accept concurrent writers: keep a larger
+        # pool so concurrent admin requests (the structures view issues many
+        # queries per POST) do not queue for a connection, check connections
+        # before use and recycle them before server-side idle timeouts.
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 20)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_pre_ping': True,
+            'pool_recycle': 1800,
+        }
+
+    # Blueprints to register.  By default every module is loaded; workers
+    # that only serve part of the application (for example the ``/api``
+    # endpoints) can set ``APP_BLUEPRINTS=api`` to skip registering the
+    # other blueprints and importing their route modules, reducing start-up
+    # time and memory.  ``auth`` and ``dashboard`` are always registered:
+    # login, logout and the page header redirect to them.  Route modules
+    # imported by a selected one are still loaded (``products`` uses
+    # helpers from ``admin``), but their blueprints are not registered.
+    APP_BLUEPRINTS = [
+        name.strip() for name in os.environ.get('APP_BLUEPRINTS', '').split(',') if name.strip()
+    ] or None
+
+    # Run the runtime schema upgrade (``app.upgrade_database``) when the
+    # application starts.  Production deployments with several workers can
+    # set ``AUTO_MIGRATE=0`` and run ``python manage.py migrate-schema`` once
+    # after each update so that worker start-up does no schema work at all.
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+    # Server-side sessions.  By default Flask keeps the session in a signed
+    # cookie, which is re-signed and re-parsed on every request and grows
+    # with the pending node/type forms stored in it.  When
+    # ``SESSION_REDIS_URL`` is set (and the optional ``Flask-Session`` and
+    # ``redis`` packages are installed) the session data is kept in Redis
+    # and the cookie only carries the session id.
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL') or None
+
+    # Development aid: when set to a positive number, every request that
+    # issues more SQL statements than this is logged with its statement
+    # count, which makes accidental lazy loads (N+1 queries) visible.
+    SQL_QUERY_WARN_THRESHOLD = int(os.environ.get('SQL_QUERY_WARN_THRESHOLD') or 0)
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
@@ -0,0 +1,52 @@
+"""
+JSON provider backed by orjson.
+
+The ``/api`` endpoints are called from asynchronous fetches on most pages
+and return plain dictionaries and lists.  When the optional ``orjson``
+package is installed, ``create_app`` installs :class:`ORJSONProvider` so
+that ``jsonify`` serialises responses with it instead of the standard
+library encoder.  Values orjson does not handle natively (dates,
+``Decimal`` and objects with ``__html__``) fall back to Flask's default
+conversion, so responses keep the same content as before.  Without
+``orjson`` the default provider is used unchanged.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """``DefaultJSONProvider`` that encodes and decodes with orjson.
+
+    Calls passing standard-library ``json.dumps`` options (``indent``,
+    ``cls``, ...) are delegated to the default implementation.
+    """
+
+    def _options(self, sort_keys):
+        # Pass dates through to ``default`` so they keep Flask's HTTP date
+        # format, and accept non-string keys like ``json.dumps`` does.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        if kwargs:
+            return super().dumps(obj, sort_keys=sort_keys, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options(sort_keys)).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Always emit compact output; pretty-printing only adds bytes.
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options(self.sort_keys))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
@@ -79,6 +79,9 @@ class StructureType(TimestampMixin):
     default_notes = db.Column(db.Text)
     default_price_per_unit = db.Column(db.Float)
     default_minimum_order_qty = db.Column(db.Integer)
+    # File name (under ``static/uploads``) of the default image uploaded on
+    # the "Definisci" page, saved as ``st_<type id>_<name>``.
+    default_image_filename = db.Column(db.String(255))
 
     # -------------------------------------------------------------------
     # Plain text accessor for default notes
@@ -130,6 +133,16 @@ class StructureType(TimestampMixin):
 
 class Structure(TimestampMixin):
     __tablename__ = 'structures'
+    # Composite indexes for the node lookups done when a node is created:
+    # the draft to finalise (same name, type, parent and typology) and the
+    # canonical non-draft node with the same code whose details are copied.
+    # Older databases get them from ``upgrade_database``.
+    __table_args__ = (
+        db.Index('ix_structure_lookup', 'name', 'type_id', 'parent_id',
+                 'flag_assembly', 'flag_part', 'flag_commercial'),
+        db.Index('ix_structure_global', 'name', 'flag_assembly', 'flag_part', 'flag_commercial',
+                 'table_assieme', 'table_parte', 'table_commerciale'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     type_id = db.Column(db.Integer, db.ForeignKey('structure_types.id'), nullable=False)
     name = db.Column(db.String(200), nullable=False)
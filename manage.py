@@ -43,7 +43,7 @@ def reset_password():
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Utility gestione utenti")
-    parser.add_argument("cmd", choices=["list-users", "create-user", "reset-password", "migrate-components"])
+    parser.add_argument("cmd", choices=["list-users", "create-user", "reset-password", "migrate-components", "migrate-schema"])
     args = parser.parse_args()
 
     if args.cmd == "list-users":
@@ -52,6 +52,16 @@ if __name__ == "__main__":
         create_user()
     elif args.cmd == "reset-password":
         reset_password()
+    elif args.cmd == "migrate-schema":
+        # Create missing tables and add missing columns.  Needed when the
+        # application runs with AUTO_MIGRATE=0, which skips this work at
+        # start-up.
+        from app import upgrade_database
+        from app.blueprints.admin.routes import _ensure_inventory_columns
+        with app.app_context():
+            upgrade_database()
+            _ensure_inventory_columns()
+        print("Schema aggiornato.")
     elif args.cmd == "migrate-components":
         # Perform data migration to the ComponentMaster architecture.
         # This command will scan all existing structures, create or reuse